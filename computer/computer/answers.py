@@ -0,0 +1,197 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app answers module."""
+
+import asyncio
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet
+from intents.models import Intent
+from texts.models import Answer, Attribute
+
+from .utils import Singleton
+
+
+class AnswerIndex(metaclass=Singleton):
+    """In-memory index for answer selection.
+
+    Maps `(intent, language, frozenset(attribute ids))` to answer texts. The index is
+    built lazily from the database and rebuilt after `invalidate`, which the signal
+    handlers in `computer.signals` and the bulk import commands call whenever
+    answers, attributes or intents change. The generation is kept in the default
+    Django cache, so with a shared cache all processes see it. Independent of that
+    the index is rebuilt after `settings.ANSWER_INDEX["ttl"]` seconds.
+    """
+
+    generation_key = "computer:answers:generation"
+
+    def __init__(self):
+        """Init."""
+        self.attributes: dict[str, dict[str | None, int]] = {}
+        self.answers: dict[tuple[str, str, frozenset[int]], list[str]] = {}
+        self.fallbacks: dict[str, list[str]] = {}
+        self.ttl = float(getattr(settings, "ANSWER_INDEX", {}).get("ttl", 300.0))
+        self._built_generation: str | None = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+
+    @property
+    def outdated(self) -> bool:
+        """Whether the index needs to be (re)built."""
+        return (
+            self._built_generation is None
+            or self._built_generation != cache.get(self.generation_key)
+            or time.monotonic() - self._built_at > self.ttl
+        )
+
+    def invalidate(self):
+        """Mark the index as outdated, it is rebuilt on the next lookup."""
+        cache.set(self.generation_key, uuid.uuid4().hex, None)
+
+    def _generation(self) -> str:
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            if not cache.add(self.generation_key, generation, None):
+                generation = cache.get(self.generation_key)
+        return generation
+
+    def build(self):
+        """Build the index from the database."""
+        generation = self._generation()
+        built_at = time.monotonic()
+        self._index(*[list(qs) for qs in self._querysets()])
+        self._built_generation = generation
+        self._built_at = built_at
+
+    async def abuild(self):
+        """Build the index from the database, asynchronous variant of `build`."""
+        generation = self._generation()
+        built_at = time.monotonic()
+        self._index(*[[row async for row in qs] for qs in self._querysets()])
+        self._built_generation = generation
+        self._built_at = built_at
+
+    def _querysets(self) -> tuple[QuerySet, QuerySet, QuerySet]:
+        return (
+            Attribute.objects.values_list("pk", "key", "value"),
+            Answer.attributes.through.objects.values_list("answer_id", "attribute_id"),
+            Intent.answers.through.objects.values_list(
+                "intent__name", "answer_id", "answer__text", "answer__language"
+            ),
+        )
+
+    def _index(
+        self,
+        attribute_rows: list[tuple[int, str, str | None]],
+        answer_attribute_rows: list[tuple[int, int]],
+        answer_rows: list[tuple[str, int, str, str]],
+    ):
+        attributes: dict[str, dict[str | None, int]] = {}
+        for pk, key, value in attribute_rows:
+            attributes.setdefault(key, {})[value] = pk
+
+        answer_attributes: dict[int, set[int]] = {}
+        for answer_id, attribute_id in answer_attribute_rows:
+            answer_attributes.setdefault(answer_id, set()).add(attribute_id)
+
+        answers: dict[tuple[str, str, frozenset[int]], list[str]] = {}
+        fallbacks: dict[str, list[str]] = {}
+        for intent, answer_id, text, language in answer_rows:
+            answers.setdefault(
+                (
+                    intent,
+                    language,
+                    frozenset(answer_attributes.get(answer_id, set())),
+                ),
+                [],
+            ).append(text)
+            if intent == "fallback":
+                fallbacks.setdefault(language, []).append(text)
+
+        self.attributes = attributes
+        self.answers = answers
+        self.fallbacks = fallbacks
+
+    def attribute_ids(self, properties: dict) -> frozenset[int]:
+        """Attribute ids matching the properties returned by an intent."""
+        ids = set()
+        for k, v in properties.items():
+            values = self.attributes.get(k)
+            if not values:
+                continue
+            if len(values) > 1:
+                v = None if v is None else str(v)
+                if v in values:
+                    ids.add(values[v])
+                elif None in values:
+                    ids.add(values[None])
+            else:
+                ids.update(values.values())
+        return frozenset(ids)
+
+    def choose(
+        self,
+        intent: str,
+        language: str,
+        properties: dict,
+        fallback_language: str | None = None,
+    ) -> str:
+        """Choose a random answer text.
+
+        Falls back to an answer of the `fallback` intent in `fallback_language`, or
+        `language` if not given, if no answer matches.
+        """
+        if self.outdated:
+            with self._lock:
+                if self.outdated:
+                    self.build()
+        return self._choose(intent, language, properties, fallback_language)
+
+    async def achoose(
+        self,
+        intent: str,
+        language: str,
+        properties: dict,
+        fallback_language: str | None = None,
+    ) -> str:
+        """Choose a random answer text, asynchronous variant of `choose`."""
+        if self.outdated:
+            async with self._async_lock:
+                if self.outdated:
+                    await self.abuild()
+        return self._choose(intent, language, properties, fallback_language)
+
+    def _choose(
+        self,
+        intent: str,
+        language: str,
+        properties: dict,
+        fallback_language: str | None,
+    ) -> str:
+        texts = self.answers.get((intent, language, self.attribute_ids(properties)))
+        if not texts:
+            texts = self.fallbacks.get(fallback_language or language, [])
+        return random.choice(texts)
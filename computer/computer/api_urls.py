@@ -26,5 +26,8 @@ from . import views
 app_name = "api"
 urlpatterns = [
     path("v1/nlu/", views.nlu, name="nlu"),
+    path("v1/nlu/async/", views.nlu_async, name="nlu_async"),
+    path("v1/nlu/batch/", views.nlu_batch, name="nlu_batch"),
+    path("v1/nlu/cache/", views.nlu_cache, name="nlu_cache"),
     path("v1/markdown/", views.markdown, name="markdown"),
 ]
@@ -30,3 +30,7 @@ class ComputerConfig(AppConfig):
     name = "computer"
     verbose_name = _("Computer")
     verbose_name_plural = _("Computers")
+
+    def ready(self):
+        """Connect signal handlers."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,147 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app nlu model backends module."""
+
+import numpy as np
+import numpy.typing as npt
+import tempfile
+import tensorflow as tf
+
+from django.utils.translation import gettext_lazy as _
+from keras import Model
+from pathlib import Path
+from tensorflow.keras.models import load_model
+from typing import Iterable
+
+
+class KerasBackend:
+    """Run predictions through `Model.predict`."""
+
+    def __init__(self, path: Path | str):
+        """Init."""
+        self.model = load_model(path)
+
+    def predict(self, x_text: npt.NDArray) -> dict[str, npt.NDArray]:
+        """Predict."""
+        return self.model.predict({"text": x_text}, batch_size=len(x_text), verbose=0)
+
+
+class FunctionBackend:
+    """Run predictions through a compiled `tf.function`.
+
+    The function has a fixed input signature, so it is traced only once, and is
+    compiled with XLA if `jit_compile` is set.
+    """
+
+    def __init__(self, path: Path | str, jit_compile: bool = True):
+        """Init."""
+        self.model = load_model(path)
+        self._predict = tf.function(
+            self._call,
+            input_signature=[tf.TensorSpec(input_shape(self.model), tf.int32)],
+            jit_compile=jit_compile,
+        )
+
+    def _call(self, x_text: tf.Tensor) -> dict[str, tf.Tensor]:
+        return self.model({"text": x_text}, training=False)
+
+    def predict(self, x_text: npt.NDArray) -> dict[str, npt.NDArray]:
+        """Predict."""
+        outs = self._predict(tf.constant(x_text, dtype=tf.int32))
+        return {k: v.numpy() for k, v in outs.items()}
+
+
+class TFLiteBackend:
+    """Run predictions through the TFLite interpreter."""
+
+    def __init__(self, path: Path | str, num_threads: int | None = None):
+        """Init."""
+        self.interpreter = tf.lite.Interpreter(
+            model_path=str(path), num_threads=num_threads
+        )
+        self.runner = self.interpreter.get_signature_runner()
+        self.input_name = next(iter(self.runner.get_input_details().keys()))
+
+    def predict(self, x_text: npt.NDArray) -> dict[str, npt.NDArray]:
+        """Predict."""
+        return self.runner(**{self.input_name: x_text.astype(np.int32)})
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "function": FunctionBackend,
+    "tflite": TFLiteBackend,
+}
+
+
+def load_backend(
+    name: str, path: Path | str, **kwargs
+) -> KerasBackend | FunctionBackend | TFLiteBackend:
+    """Load the model at `path` with the backend `name`."""
+    if name not in BACKENDS:
+        raise ValueError(
+            _('Unknown backend "%(name)s", choose one of %(backends)s.')
+            % {"name": name, "backends": ", ".join(BACKENDS.keys())}
+        )
+    return BACKENDS[name](path, **kwargs)
+
+
+def input_shape(model: Model) -> tuple[int | None, int | None]:
+    """Input shape of the text input of a model."""
+    return (None, model.inputs[0].shape[1])
+
+
+def to_tflite(
+    model: Model,
+    quantization: str = "none",
+    representative_data: Iterable[npt.NDArray] | None = None,
+) -> bytes:
+    """Convert a keras model to TFLite.
+
+    Quantization is one of `none`, `dynamic` (int8 weights) and `int8` (int8 weights
+    and activations, calibrated on `representative_data`).
+    """
+    if quantization not in ["none", "dynamic", "int8"]:
+        raise ValueError(
+            _('Unknown quantization "%(quantization)s".')
+            % {"quantization": quantization}
+        )
+    if quantization == "int8" and representative_data is None:
+        raise ValueError(_("Int8 quantization needs representative data."))
+
+    # converting a concrete function leaves the states of the dropout seed
+    # generators unresolved in the TFLite model, an exported SavedModel does not
+    with tempfile.TemporaryDirectory() as path:
+        model.export(
+            path,
+            format="tf_saved_model",
+            verbose=False,
+            input_signature=[
+                {"text": tf.TensorSpec(input_shape(model), tf.int32, name="text")}
+            ],
+        )
+        converter = tf.lite.TFLiteConverter.from_saved_model(path)
+        if quantization in ["dynamic", "int8"]:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == "int8" and representative_data is not None:
+            data = representative_data
+            converter.representative_dataset = lambda: (
+                [x[np.newaxis].astype(np.int32)] for x in data
+            )
+        return converter.convert()
@@ -0,0 +1,138 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app cache module."""
+
+import copy
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+from django.core.cache import caches
+from typing import Any
+
+
+class LRUCache:
+    """Thread-safe, bounded LRU cache where entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        """Init."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of entries, including expired ones not yet evicted."""
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value, counts as hit or miss."""
+        with self._lock:
+            if key in self._data:
+                expires, value = self._data[key]
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any):
+        """Set a value, evicts the least recently used entry when full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Hit and miss counts."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+class PredictionCache:
+    """Cache of NLU predictions keyed on the cleaned text.
+
+    Predictions are kept in process in an `LRUCache` and, if `alias` is given, also
+    in that Django cache. Keys include the `version` of the model, so a new model
+    never sees predictions of an old one.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        maxsize: int = 1024,
+        ttl: float = 3600.0,
+        alias: str | None = None,
+    ):
+        """Init."""
+        self.version = version
+        self.alias = alias
+        self.local = LRUCache(maxsize, ttl)
+        self.shared_hits = 0
+
+    def _key(self, text: str) -> str:
+        return "computer:nlu:%s:%s" % (
+            self.version,
+            hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        )
+
+    def get(self, text: str) -> dict | None:
+        """Get a copy of the prediction for `text`."""
+        prediction = self.local.get(text)
+        if prediction is None and self.alias is not None:
+            prediction = caches[self.alias].get(self._key(text))
+            if prediction is not None:
+                self.shared_hits += 1
+                self.local.set(text, prediction)
+        return None if prediction is None else copy.deepcopy(prediction)
+
+    def set(self, text: str, prediction: dict):
+        """Store a copy of the prediction for `text`."""
+        prediction = copy.deepcopy(prediction)
+        self.local.set(text, prediction)
+        if self.alias is not None:
+            caches[self.alias].set(self._key(text), prediction, self.local.ttl)
+
+    def stats(self) -> dict[str, int | float | str | None]:
+        """Hit and miss counts."""
+        return self.local.stats() | {
+            "shared_hits": self.shared_hits,
+            "alias": self.alias,
+            "version": self.version,
+        }
@@ -0,0 +1,221 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app text corpus module.
+
+Reading and tokenizing of the text corpus for training. Files are read in spawned
+worker processes, which import this module, so it is kept free of keras and
+TensorFlow imports.
+"""
+
+import gzip
+import hashlib
+import json
+import multiprocessing
+import numpy as np
+import numpy.typing as npt
+import os
+import shutil
+import string
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+from django.utils.translation import gettext_lazy as _
+from logging import Logger
+from pathlib import Path
+from typing import Callable
+
+
+def base_vocab() -> dict[str, int]:
+    """Vocab every corpus starts with, new characters are added while tokenizing."""
+    return {
+        "<begin of sequence>": 1,
+        "<end of sequence>": 2,
+        "<fallback character>": 3,
+    } | {
+        k: i + 4
+        for i, k in enumerate(
+            [" "]
+            + sorted(list(string.ascii_letters), key=lambda x: x.lower())
+            + list(string.digits + string.punctuation)
+        )
+    }
+
+
+def read_texts(path: Path | str) -> list[str]:
+    """Read the texts from a text or JSON file, optionally gzip compressed."""
+    if isinstance(path, str):
+        path = Path(path)
+
+    fopen: Callable = open
+    if path.suffix == ".gz":
+        fopen = gzip.open
+
+    texts = []
+    with fopen(path, "rt", encoding="utf8") as f:
+        if path.suffix == ".json":
+            data = json.loads(f.read())
+            if "title" in data.keys():
+                texts.append(data["title"])
+            if "lead" in data.keys():
+                texts.append(data["lead"])
+            if "text" in data.keys():
+                texts.append(data["text"])
+        else:
+            texts.append(f.read().strip())
+    return texts
+
+
+def read_codepoints(
+    path: Path | str,
+) -> tuple[npt.NDArray[np.uint32], npt.NDArray[np.int64]]:
+    """Read the texts from a file as one array of codepoints and their lengths."""
+    texts = read_texts(path)
+    return (
+        np.frombuffer(
+            "".join(texts).encode("utf-32-le", "surrogatepass"), dtype="<u4"
+        ).astype(np.uint32),
+        np.asarray([len(text) for text in texts], dtype=np.int64),
+    )
+
+
+def tokenize(
+    paths: list[Path | str],
+    vocab: dict[str, int],
+    context_size: int,
+    _log: Logger,
+    workers: int = 1,
+) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int64], dict[str, int]]:
+    """Tokenize the texts in the given files.
+
+    Files are read with `workers` spawned processes, forking is not safe once
+    TensorFlow started its threads. New characters are added to the vocab
+    in order of their first appearance, so the result does not depend on the
+    number of workers.
+
+    Returns the flat token array, padded with `context_size + 1` zeros so there is a
+    full window for every position, the offsets of the texts in it and the vocab
+    extended by all new characters.
+    """
+    vocab = dict(vocab)
+    _log.info(_("Loading texts from files."))
+    codepoints: list[npt.NDArray[np.uint32]] = []
+    lengths: list[npt.NDArray[np.int64]] = []
+    # imported here, so the worker processes do not import keras
+    from keras.utils import Progbar
+
+    progbar = Progbar(len(paths), width=30)
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(
+            min(workers, len(paths)), mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            for file_codepoints, file_lengths in executor.map(read_codepoints, paths):
+                codepoints.append(file_codepoints)
+                lengths.append(file_lengths)
+                progbar.add(1)
+    else:
+        for p in paths:
+            file_codepoints, file_lengths = read_codepoints(p)
+            codepoints.append(file_codepoints)
+            lengths.append(file_lengths)
+            progbar.add(1)
+
+    all_codepoints = np.concatenate([np.zeros(0, dtype=np.uint32)] + codepoints)
+    uniques, first = np.unique(all_codepoints, return_index=True)
+    ids = np.asarray([vocab.get(chr(c), 0) for c in uniques], dtype=np.int32)
+    for i in np.argsort(first):
+        if ids[i] == 0:
+            ids[i] = vocab.setdefault(chr(uniques[i]), len(vocab) + 1)
+
+    # every text is wrapped in begin and end of sequence
+    text_lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + lengths) + 2
+    offsets = np.zeros(len(text_lengths) + 1, dtype=np.int64)
+    np.cumsum(text_lengths, out=offsets[1:])
+    tokens = np.zeros(offsets[-1] + context_size + 1, dtype=np.int32)
+    is_text = np.ones(offsets[-1], dtype=bool)
+    is_text[offsets[:-1]] = False
+    is_text[offsets[1:] - 1] = False
+    tokens[: offsets[-1]][is_text] = ids[np.searchsorted(uniques, all_codepoints)]
+    tokens[offsets[:-1]] = vocab["<begin of sequence>"]
+    tokens[offsets[1:] - 1] = vocab["<end of sequence>"]
+    return tokens, offsets, vocab
+
+
+def corpus_key(
+    paths: list[Path | str], vocab: dict[str, int], context_size: int
+) -> str:
+    """Key of a tokenized corpus.
+
+    Hash of the vocab, the context size and path, size and modification time of
+    every input file.
+    """
+    h = hashlib.sha256(json.dumps([vocab, context_size]).encode("utf8"))
+    for p in paths:
+        stat = os.stat(p)
+        h.update(f"{Path(p).absolute()}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def prepare_corpus(
+    paths: list[Path | str],
+    cache_dir: Path | str,
+    context_size: int,
+    _log: Logger,
+    workers: int = 1,
+) -> Path:
+    """Tokenize the texts in the given files into `cache_dir`, if not done yet.
+
+    Returns the directory containing `tokens.npy`, `offsets.npy` and `vocab.json`.
+    """
+    vocab = base_vocab()
+    path = Path(cache_dir) / corpus_key(paths, vocab, context_size)
+    if path.exists():
+        _log.info(_("Using tokenized corpus %(path)s.") % {"path": path})
+        return path
+
+    tokens, offsets, vocab = tokenize(paths, vocab, context_size, _log, workers)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    os.chmod(tmp_path, 0o755)
+    np.save(tmp_path / "tokens.npy", tokens)
+    np.save(tmp_path / "offsets.npy", offsets)
+    with open(tmp_path / "vocab.json", "w", encoding="utf8") as f:
+        f.write(json.dumps(vocab, ensure_ascii=False))
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # prepared concurrently by another process
+        if not path.exists():
+            raise
+        shutil.rmtree(tmp_path)
+    _log.info(_("Saved tokenized corpus to %(path)s.") % {"path": path})
+    return path
+
+
+def load_corpus(
+    path: Path | str,
+) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int64], dict[str, int]]:
+    """Load a tokenized corpus, the token array is memory-mapped."""
+    path = Path(path)
+    with open(path / "vocab.json", "r", encoding="utf8") as f:
+        vocab = json.loads(f.read())
+    return (
+        np.load(path / "tokens.npy", mmap_mode="r"),
+        np.load(path / "offsets.npy"),
+        vocab,
+    )
@@ -0,0 +1,140 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app convert command."""
+
+import json
+import numpy as np
+import numpy.typing as npt
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+from keras.utils import Progbar
+from pathlib import Path
+from tensorflow.keras.models import load_model
+from texts.models import Trigger
+
+from ...backends import load_backend, to_tflite
+from ...nlu_models import TextEncoder
+
+
+class Command(BaseCommand):
+    """Convert a nn-model to TFLite."""
+
+    help = _(
+        "Convert a nn-model to TFLite and compare latency and accuracy of the "
+        + "backends."
+    )
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument(
+            "model",
+            type=lambda p: Path(p).absolute(),
+            help=_("Keras model to convert, e.g. computer-nn.keras."),
+        )
+        parser.add_argument(
+            "mappings",
+            type=lambda p: Path(p).absolute(),
+            help=_("Mappings of the model, mappings.json."),
+        )
+        parser.add_argument(
+            "output",
+            type=lambda p: Path(p).absolute(),
+            help=_("Path of the TFLite model."),
+        )
+        parser.add_argument(
+            "--quantization",
+            choices=["none", "dynamic", "int8"],
+            default="dynamic",
+        )
+        parser.add_argument(
+            "--samples",
+            default=1000,
+            type=int,
+            help=_("Number of triggers for calibration and evaluation."),
+        )
+
+    def handle(self, *args, **options):
+        """Handle command."""
+        with open(options["mappings"], "r", encoding="utf-8") as f:
+            mappings = json.loads(f.read())
+
+        x_text, y_intent = self._triggers(mappings, options["samples"])
+        if len(x_text) == 0:
+            raise CommandError(_("No triggers found for the evaluation."))
+
+        self.stdout.write(
+            _('Converting "%(model)s" with quantization "%(quantization)s".')
+            % {"model": options["model"], "quantization": options["quantization"]}
+        )
+        options["output"].write_bytes(
+            to_tflite(load_model(options["model"]), options["quantization"], x_text)
+        )
+
+        reference = None
+        for name, path in [
+            ("keras", options["model"]),
+            ("function", options["model"]),
+            ("tflite", options["output"]),
+        ]:
+            backend = load_backend(name, path)
+            # first call builds/traces the backend and is not timed
+            backend.predict(x_text[:1])
+
+            intents = np.zeros(len(x_text), dtype=np.int32)
+            latencies = np.zeros(len(x_text))
+            progbar = Progbar(len(x_text), width=30)
+            for i in range(len(x_text)):
+                start = time.perf_counter()
+                outs = backend.predict(x_text[i : i + 1])
+                latencies[i] = time.perf_counter() - start
+                intents[i] = outs["intent"][0].argmax()
+                progbar.add(1)
+            if reference is None:
+                reference = intents
+
+            self.stdout.write(
+                _(
+                    "%(name)s: %(latency).3fms mean, %(p95).3fms p95 latency, "
+                    + "%(accuracy).4f accuracy, %(agreement).4f agreement with keras"
+                )
+                % {
+                    "name": name,
+                    "latency": latencies.mean() * 1000,
+                    "p95": np.percentile(latencies, 95) * 1000,
+                    "accuracy": (intents == y_intent).mean(),
+                    "agreement": (intents == reference).mean(),
+                }
+            )
+
+    def _triggers(
+        self, mappings: dict, samples: int
+    ) -> tuple[npt.NDArray, npt.NDArray]:
+        texts = []
+        intents = []
+        for text, intent in (
+            Trigger.objects.filter(intent__name__in=mappings["intents"].keys())
+            .order_by("?")
+            .values_list("text", "intent__name")[:samples]
+        ):
+            texts.append(text)
+            intents.append(mappings["intents"][intent])
+        encoder = TextEncoder(mappings["vocab"], mappings["context_size"])
+        return encoder.encode(texts), np.asarray(intents, dtype=np.int32)
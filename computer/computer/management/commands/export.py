@@ -18,13 +18,18 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app export command."""
 
+import gzip
 import json
 import sys
+import textwrap
 
 from argparse import FileType
 from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
 from django.utils.translation import gettext_lazy as _
-from texts.models import Trigger
+from intents.models import Intent
+from texts.models import Entity, Trigger, TriggerEntity
+from typing import Iterator, TextIO
 
 
 class Command(BaseCommand):
@@ -40,11 +45,101 @@ class Command(BaseCommand):
             type=FileType("w", encoding="utf8"),
             default=sys.stdout,
         )
+        parser.add_argument(
+            "--format",
+            choices=["json", "jsonl"],
+            default="json",
+            help=_("Write a JSON document or one trigger per line (JSON Lines)."),
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help=_("Compress the output, default for output files ending in .gz."),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            default=1000,
+            type=int,
+            help=_("Number of triggers fetched per query."),
+        )
 
     def handle(self, *args, **options):
         """Handle command."""
-        data = {"triggers": []}
-        for trigger in Trigger.objects.all():
-            data["triggers"].append(trigger.to_dict())
-        options["output"].write(json.dumps(data, ensure_ascii=False, indent=4))
-        options["output"].write("\n")
+        output = options["output"]
+        if options["gzip"] or output.name.endswith(".gz"):
+            output.flush()
+            output = gzip.open(output.buffer, "wt", encoding="utf8")
+
+        triggers = self.triggers(options["chunk_size"])
+        if options["format"] == "jsonl":
+            for trigger in triggers:
+                output.write(json.dumps(trigger, ensure_ascii=False))
+                output.write("\n")
+        else:
+            self._write_json(output, triggers)
+
+        if output is not options["output"]:
+            output.close()
+
+    def triggers(self, chunk_size: int) -> Iterator[dict]:
+        """Triggers as dictionaries, same as `Trigger.to_dict`.
+
+        Intents with their answers and entities are loaded once upfront, triggers
+        with their entities in chunks of `chunk_size`.
+        """
+        intents = {
+            intent.pk: intent.to_dict()
+            for intent in Intent.objects.prefetch_related("answers__attributes")
+        }
+        entities = {entity.pk: entity for entity in Entity.objects.all()}
+        entity_dicts: dict[int, dict] = {}
+
+        def entity_dict(pk: int) -> dict:
+            if pk not in entity_dicts:
+                entity = entities[pk]
+                entity_dicts[pk] = {
+                    "name": entity.name,
+                    "parent": (
+                        None
+                        if entity.parent_id is None
+                        else entity_dict(entity.parent_id)
+                    ),
+                }
+            return entity_dicts[pk]
+
+        for trigger in Trigger.objects.prefetch_related(
+            Prefetch(
+                "entities",
+                queryset=TriggerEntity.objects.only(
+                    "trigger_id", "entity_id", "start", "end", "value"
+                ),
+            )
+        ).iterator(chunk_size):
+            yield {
+                "text": trigger.text,
+                "language": trigger.language,
+                "intent": intents[trigger.intent_id],
+                "entities": [
+                    {
+                        "start": e.start,
+                        "end": e.end,
+                        "value": e.value,
+                        "entity": entity_dict(e.entity_id),
+                    }
+                    for e in trigger.entities.all()
+                ],
+            }
+
+    def _write_json(self, output: TextIO, triggers: Iterator[dict]):
+        """Write the document of `json.dumps(indent=4)` one trigger at a time."""
+        output.write('{\n    "triggers": [')
+        separator = "\n"
+        for trigger in triggers:
+            output.write(separator)
+            output.write(
+                textwrap.indent(
+                    json.dumps(trigger, ensure_ascii=False, indent=4), " " * 8
+                )
+            )
+            separator = ",\n"
+        output.write("\n    ]\n}\n" if separator == ",\n" else "]\n}\n")
@@ -18,61 +18,319 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app import command."""
 
+import gzip
+import itertools
 import json
 import sys
+import time
 
 from argparse import FileType
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from intents.models import Intent
 from texts.models import Answer, Attribute, Entity, Trigger, TriggerEntity
+from typing import BinaryIO, Iterable, Iterator
+
+from ...answers import AnswerIndex
 
 
 class Command(BaseCommand):
-    """Export data."""
+    """Import data."""
 
-    help = _("Export data.")
+    help = _("Import data.")
 
     def add_arguments(self, parser):
         """Command arguments."""
         parser.add_argument(
             "input",
             nargs="?",
-            type=FileType("r", encoding="utf8"),
-            default=sys.stdout,
+            type=FileType("rb"),
+            default=sys.stdin.buffer,
+            help=_("Export to import, gzip compressed input is detected."),
+        )
+        parser.add_argument(
+            "--format",
+            choices=["json", "jsonl"],
+            default="json",
+            help=_("A JSON document or one trigger per line (JSON Lines)."),
+        )
+        parser.add_argument(
+            "--offset",
+            default=0,
+            type=int,
+            help=_(
+                "Resume a JSON Lines import at this byte offset of the uncompressed "
+                + "input, as reported after each batch."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            default=1000,
+            type=int,
+            help=_("Number of triggers imported per transaction."),
         )
 
     def handle(self, *args, **options):
         """Handle command."""
-        data = json.loads(options["input"].read())
-        for i in data["triggers"]:
-            intent, _ = Intent.objects.get_or_create(name=i["intent"]["name"])
-            for j in i["intent"]["answers"]:
-                answer, _ = Answer.objects.get_or_create(
-                    text=j["text"], language=j["language"]
+        if options["offset"] and options["format"] != "jsonl":
+            raise CommandError(_("An offset needs JSON Lines input."))
+
+        f = options["input"]
+        if f.peek(2)[:2] == b"\x1f\x8b":
+            f = gzip.GzipFile(fileobj=f)
+        if options["format"] == "jsonl":
+            records = self._read_jsonl(f, options["offset"])
+        else:
+            records = ((None, t) for t in json.loads(f.read())["triggers"])
+        self.import_triggers(records, options["batch_size"])
+
+    def import_triggers(
+        self, records: Iterable[tuple[int | None, dict]], batch_size: int
+    ) -> int:
+        """Import triggers in batches, each in its own transaction.
+
+        Records are pairs of the input offset after a trigger, if known, and the
+        trigger. Intents, attributes and entities are kept in memory, existing
+        answers, triggers and their relations are looked up per batch. So memory
+        depends on the batch size and these tables, not on the number of triggers.
+        Returns the number of triggers read.
+        """
+        self.intents = dict(Intent.objects.values_list("name", "pk"))
+        self.attributes = {
+            (key, value): pk
+            for pk, key, value in Attribute.objects.values_list("pk", "key", "value")
+        }
+        self.entities = dict(Entity.objects.values_list("name", "pk"))
+        self.batch_size = batch_size
+        self.rows = 0
+
+        count = 0
+        start = time.perf_counter()
+        records = iter(records)
+        while batch := list(itertools.islice(records, batch_size)):
+            with transaction.atomic():
+                self._import_batch([trigger for offset, trigger in batch])
+            count += len(batch)
+            seconds = time.perf_counter() - start
+            msg = _(
+                "%(triggers)d triggers, %(rows)d new rows in %(seconds).1fs, "
+                + "%(rate).0f rows/s."
+            ) % {
+                "triggers": count,
+                "rows": self.rows,
+                "seconds": seconds,
+                "rate": self.rows / seconds,
+            }
+            if batch[-1][0] is not None:
+                msg += " " + _("Offset %(offset)d.") % {"offset": batch[-1][0]}
+            self.stdout.write(msg)
+        # bulk inserts send no signals, this reaches servers sharing the cache
+        AnswerIndex().invalidate()
+        return count
+
+    def _read_jsonl(self, f: BinaryIO, offset: int) -> Iterator[tuple[int, dict]]:
+        """Read triggers line by line, starting at `offset`."""
+        if offset:
+            f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if line.strip():
+                yield offset, json.loads(line)
+
+    def _import_batch(self, triggers: list[dict]):
+        intents: set[str] = set()
+        answers: set[tuple[str, str]] = set()
+        attributes: set[tuple[str, str | None]] = set()
+        intent_answers: set[tuple[str, tuple[str, str]]] = set()
+        answer_attributes: set[tuple[tuple[str, str], tuple[str, str | None]]] = set()
+        entities: dict[str, str | None] = {}
+        for trigger in triggers:
+            intents.add(trigger["intent"]["name"])
+            for answer in trigger["intent"]["answers"]:
+                answer_key = (answer["text"], answer["language"])
+                answers.add(answer_key)
+                intent_answers.add((trigger["intent"]["name"], answer_key))
+                for attribute in answer["attributes"]:
+                    attribute_key = (attribute["key"], attribute["value"])
+                    attributes.add(attribute_key)
+                    answer_attributes.add((answer_key, attribute_key))
+            for trigger_entity in trigger["entities"]:
+                for entity in self._entity_chain(trigger_entity["entity"]):
+                    entities.setdefault(entity["name"], self._parent_name(entity))
+
+        self._create(
+            Intent,
+            self.intents,
+            [Intent(name=name) for name in intents if name not in self.intents],
+            lambda names: Intent.objects.filter(name__in=names).values_list(
+                "name", "pk"
+            ),
+        )
+        answer_ids = self._text_ids(Answer, answers)
+        self._create(
+            Answer,
+            answer_ids,
+            [
+                Answer(text=text, language=language)
+                for text, language in answers
+                if (text, language) not in answer_ids
+            ],
+            lambda keys: self._text_ids(Answer, keys).items(),
+        )
+        self._create(
+            Attribute,
+            self.attributes,
+            [
+                Attribute(key=key, value=value)
+                for key, value in attributes
+                if (key, value) not in self.attributes
+            ],
+            lambda keys: (
+                ((key, value), pk)
+                for pk, key, value in Attribute.objects.filter(
+                    key__in={key for key, value in keys}
+                ).values_list("pk", "key", "value")
+            ),
+        )
+        self._create_entities(entities)
+        unique_triggers = {(t["text"], t["language"]): t for t in triggers}
+        trigger_ids = self._text_ids(Trigger, set(unique_triggers.keys()))
+        self._create(
+            Trigger,
+            trigger_ids,
+            [
+                Trigger(
+                    text=text,
+                    language=language,
+                    intent_id=self.intents[trigger["intent"]["name"]],
                 )
-                intent.answers.add(answer)
-                for k in j["attributes"]:
-                    attribute, _ = Attribute.objects.get_or_create(
-                        key=k["key"], value=k["value"]
+                for (text, language), trigger in unique_triggers.items()
+                if (text, language) not in trigger_ids
+            ],
+            lambda keys: self._text_ids(Trigger, keys).items(),
+        )
+
+        self._link(
+            Intent.answers.through,
+            "answer_id",
+            "intent_id",
+            {(answer_ids[a], self.intents[i]) for i, a in intent_answers},
+        )
+        self._link(
+            Answer.attributes.through,
+            "answer_id",
+            "attribute_id",
+            {(answer_ids[a], self.attributes[b]) for a, b in answer_attributes},
+        )
+
+        existing = set()
+        for pks in self._chunks(trigger_ids.values()):
+            existing.update(
+                TriggerEntity.objects.filter(trigger_id__in=pks).values_list(
+                    "trigger_id", "entity_id", "start", "end", "value"
+                )
+            )
+        trigger_entities = []
+        for trigger in triggers:
+            for trigger_entity in trigger["entities"]:
+                key = (
+                    trigger_ids[(trigger["text"], trigger["language"])],
+                    self.entities[trigger_entity["entity"]["name"]],
+                    trigger_entity["start"],
+                    trigger_entity["end"],
+                    trigger_entity["value"],
+                )
+                if key not in existing:
+                    existing.add(key)
+                    trigger_entities.append(
+                        TriggerEntity(
+                            trigger_id=key[0],
+                            entity_id=key[1],
+                            start=key[2],
+                            end=key[3],
+                            value=key[4],
+                        )
                     )
-                    answer.attributes.add(attribute)
-            trigger, _ = Trigger.objects.get_or_create(
-                text=i["text"], language=i["language"], intent=intent
+        self.rows += len(TriggerEntity.objects.bulk_create(trigger_entities))
+
+    def _create(self, model, ids: dict, objs: list, query):
+        """Insert new objects and add the ids of the given keys to `ids`."""
+        if not objs:
+            return
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+        keys = {self._key(obj) for obj in objs}
+        for key, pk in query(keys):
+            if key in keys:
+                ids[key] = pk
+        self.rows += len(objs)
+
+    def _link(self, through, source: str, target: str, pairs: set):
+        """Insert the new rows of an m2m through model."""
+        for pks in self._chunks({i for i, j in pairs}):
+            pairs -= set(
+                through.objects.filter(**{source + "__in": pks}).values_list(
+                    source, target
+                )
             )
-            for j in i["entities"]:
-                entity = self._create_entity(j["entity"])
-                triggerentity, _ = TriggerEntity.objects.get_or_create(
-                    start=j["start"],
-                    end=j["end"],
-                    value=j["value"],
-                    entity=entity,
-                    trigger=trigger,
+        through.objects.bulk_create(
+            [through(**{source: i, target: j}) for i, j in pairs],
+            ignore_conflicts=True,
+        )
+        self.rows += len(pairs)
+
+    def _text_ids(self, model, keys: set[tuple[str, str]]) -> dict:
+        """Ids of the existing answers or triggers with the given keys."""
+        ids = {}
+        for texts in self._chunks({text for text, language in keys}):
+            for pk, text, language in model.objects.filter(text__in=texts).values_list(
+                "pk", "text", "language"
+            ):
+                if (text, language) in keys:
+                    ids[(text, language)] = pk
+        return ids
+
+    def _chunks(self, values: Iterable) -> Iterator[list]:
+        values = iter(values)
+        while chunk := list(itertools.islice(values, self.batch_size)):
+            yield chunk
+
+    def _key(self, obj) -> str | tuple:
+        if isinstance(obj, Intent):
+            return obj.name
+        elif isinstance(obj, Attribute):
+            return (obj.key, obj.value)
+        return (obj.text, obj.language)
+
+    def _create_entities(self, entities: dict[str, str | None]):
+        """Create new entities, parents before their children."""
+        new = {name for name in entities.keys() if name not in self.entities}
+        while new:
+            level = [
+                Entity(
+                    name=name,
+                    parent_id=(
+                        None
+                        if entities[name] is None
+                        else self.entities[entities[name]]
+                    ),
                 )
+                for name in new
+                if entities[name] is None or entities[name] not in new
+            ]
+            Entity.objects.bulk_create(level, ignore_conflicts=True)
+            self.entities.update(
+                Entity.objects.filter(
+                    name__in=[entity.name for entity in level]
+                ).values_list("name", "pk")
+            )
+            self.rows += len(level)
+            new -= {entity.name for entity in level}
+
+    def _entity_chain(self, data: dict) -> Iterator[dict]:
+        while data is not None:
+            yield data
+            data = data["parent"]
 
-    def _create_entity(self, data) -> Entity:
-        parent = None
-        if data["parent"] is not None:
-            parent = self._create_entity(data["parent"])
-        entity, _ = Entity.objects.get_or_create(name=data["name"], parent=parent)
-        return entity
+    def _parent_name(self, data: dict) -> str | None:
+        return None if data["parent"] is None else data["parent"]["name"]
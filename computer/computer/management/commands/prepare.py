@@ -0,0 +1,72 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app prepare command."""
+
+import logging
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+from pathlib import Path
+
+from ...corpus import prepare_corpus
+
+
+class Command(BaseCommand):
+    """Django command to tokenize a text corpus for training."""
+
+    help = _(
+        "Tokenize text files into the corpus cache used by train --cache-dir, so "
+        + "runs on the same files skip the preprocessing."
+    )
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument(
+            "cache_dir",
+            type=lambda p: Path(p).absolute(),
+            help=_("Directory of tokenized corpora."),
+        )
+        parser.add_argument(
+            "text_data",
+            nargs="+",
+            type=lambda p: Path(p).absolute(),
+        )
+        parser.add_argument(
+            "--workers",
+            default=os.cpu_count(),
+            type=int,
+            help=_("Number of processes reading and tokenizing the text files."),
+        )
+        parser.add_argument(
+            "--context-size",
+            default=100,
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        """Handle command."""
+        path = prepare_corpus(
+            options["text_data"],
+            options["cache_dir"],
+            options["context_size"],
+            logging.getLogger(__name__),
+            options["workers"],
+        )
+        self.stdout.write(str(path))
@@ -0,0 +1,232 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app sweep command."""
+
+import django
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import CommandError
+from django.utils.translation import gettext_lazy as _
+from pathlib import Path
+from sacred.observers import FileStorageObserver
+from typing import Any
+
+from ...corpus import prepare_corpus
+from .train import Command as TrainCommand, ex
+
+
+def run_trial(basedir: str, config: dict, updates: dict) -> int:
+    """Run a single trial of the experiment, returns its run id."""
+    ex.observers.append(FileStorageObserver(basedir))
+    ex.add_config(config)
+    return ex.run(config_updates=updates)._id
+
+
+def parse_value(value: str) -> Any:
+    """Parse a JSON value, everything else is a string."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_param(param: str) -> tuple[str, list | tuple[Any, Any]]:
+    """Parse `KEY=V1,V2,...` to a list of values or `KEY=LOW:HIGH` to a range."""
+    key, _sep, values = param.partition("=")
+    if not key or not values:
+        raise CommandError(
+            _('Invalid parameter "%(param)s", expected KEY=V1,V2,... or KEY=LOW:HIGH.')
+            % {"param": param}
+        )
+    if ":" in values and "," not in values:
+        low, high = values.split(":", 1)
+        return key, (parse_value(low), parse_value(high))
+    return key, [parse_value(v) for v in values.split(",")]
+
+
+class Command(TrainCommand):
+    """Django command to run a hyperparameter sweep."""
+
+    help = _(
+        "Train nn-models for a grid or random search space in parallel processes "
+        + "and rank them."
+    )
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--param",
+            nargs="+",
+            required=True,
+            help=_(
+                "Search space as KEY=V1,V2,... with the values to try, for random "
+                + "search also KEY=LOW:HIGH for a range. Keys are config entries, "
+                + "e.g. units or adamw.learning_rate."
+            ),
+        )
+        parser.add_argument(
+            "--random",
+            type=int,
+            metavar="TRIALS",
+            help=_("Sample the given number of trials instead of the full grid."),
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            help=_("Seed for sampling random trials."),
+        )
+        parser.add_argument(
+            "--parallel",
+            default=2,
+            type=int,
+            help=_(
+                "Number of trials to run at the same time. Unless thread counts "
+                + "are given the CPUs are split between them."
+            ),
+        )
+        parser.add_argument(
+            "--metric",
+            default="loss",
+            help=_("Final metric of the nlu-model to rank the trials by."),
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["min", "max"],
+            default="min",
+        )
+        parser.add_argument(
+            "--output",
+            type=lambda p: Path(p).absolute(),
+            help=_("Save the ranked summary as JSON."),
+        )
+
+    def handle(self, *args, **options):
+        """Handle command."""
+        if options["resume"] is not None or options["benchmark"] is not None:
+            raise CommandError(_("A sweep can not resume or benchmark runs."))
+
+        basedir = options["SACRED_BASEDIR"]
+        config = self.config(options)
+        space = dict(parse_param(param) for param in options["param"])
+        for key in space.keys():
+            if key.split(".")[0] not in config:
+                raise CommandError(_('Unknown config entry "%(key)s".') % {"key": key})
+
+        if options["random"] is None:
+            if any(isinstance(values, tuple) for values in space.values()):
+                raise CommandError(_("Ranges are only supported for random search."))
+            trials = [
+                dict(zip(space.keys(), values))
+                for values in itertools.product(*space.values())
+            ]
+        else:
+            rng = random.Random(options["seed"])
+            trials = [
+                {k: self._sample(v, rng) for k, v in space.items()}
+                for i in range(options["random"])
+            ]
+
+        # all trials load the same tokenized corpus memory-mapped
+        if config["cache_dir"] is None:
+            config["cache_dir"] = str(basedir / "corpus")
+        for context_size in {
+            trial.get("context_size", config["context_size"]) for trial in trials
+        }:
+            prepare_corpus(
+                config["texts"],
+                config["cache_dir"],
+                context_size,
+                logging.getLogger(__name__),
+                config["workers"],
+            )
+        if config["threads"]["inter_op"] == 0 and config["threads"]["intra_op"] == 0:
+            threads = max(1, (os.cpu_count() or 1) // options["parallel"])
+            config["threads"] = {"inter_op": threads, "intra_op": threads}
+
+        self.stdout.write(
+            _("Running %(trials)d trials, %(parallel)d at a time.")
+            % {"trials": len(trials), "parallel": options["parallel"]}
+        )
+        # every trial in a fresh process, TensorFlow and Keras keep global state
+        runs = {}
+        with ProcessPoolExecutor(
+            options["parallel"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+            max_tasks_per_child=1,
+        ) as executor:
+            futures = {
+                executor.submit(run_trial, str(basedir), config, trial): i
+                for i, trial in enumerate(trials)
+            }
+            for future in as_completed(futures):
+                trial = trials[futures[future]]
+                try:
+                    runs[future.result()] = trial
+                    self.stdout.write(_("Finished trial %(trial)s.") % {"trial": trial})
+                except Exception as e:
+                    self.stderr.write(
+                        _("Trial %(trial)s failed: %(error)s")
+                        % {"trial": trial, "error": e}
+                    )
+
+        summary = self._summary(basedir, runs, options["metric"], options["mode"])
+        for rank, entry in enumerate(summary, start=1):
+            self.stdout.write(
+                f"{rank:>3}. run {entry['id']}: {options['metric']}="
+                + f"{entry['metric']:.6g} "
+                + " ".join(f"{k}={v}" for k, v in entry["params"].items())
+            )
+        if options["output"] is not None:
+            with open(options["output"], "w", encoding="utf8") as f:
+                f.write(json.dumps(summary, indent=4))
+
+    def _sample(self, values: list | tuple[Any, Any], rng: random.Random) -> Any:
+        if isinstance(values, list):
+            return rng.choice(values)
+        low, high = values
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+
+    def _summary(
+        self, basedir: Path, runs: dict[int, dict], metric: str, mode: str
+    ) -> list[dict]:
+        summary = []
+        for run_id, params in runs.items():
+            with open(basedir / str(run_id) / "run.json", "r", encoding="utf8") as f:
+                run = json.loads(f.read())
+            if run["status"] != "COMPLETED" or metric not in (run["result"] or {}):
+                continue
+            summary.append(
+                {
+                    "id": run_id,
+                    "metric": run["result"][metric],
+                    "params": params,
+                    "result": run["result"],
+                }
+            )
+        return sorted(summary, key=lambda entry: entry["metric"], reverse=mode == "max")
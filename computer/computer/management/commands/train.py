@@ -18,16 +18,18 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app train command."""
 
-import gzip
+import itertools
 import json
 import math
 import numpy as np
 import numpy.typing as npt
-import string
+import os
+import tensorflow as tf
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import gettext_lazy as _
-from keras import Model
+from keras import Model, mixed_precision, ops
 from keras.callbacks import Callback, EarlyStopping, ReduceLROnPlateau
 from keras.layers import (
     Input,
@@ -36,20 +38,24 @@ from keras.layers import (
     Dense,
     Embedding,
     Flatten,
+    GlobalAveragePooling1D,
     SpatialDropout1D,
 )
 from keras.optimizers import AdamW
-from keras.utils import Progbar, PyDataset, to_categorical
+from keras.utils import PyDataset
 from logging import Logger
+from numpy.lib.stride_tricks import sliding_window_view
 from pathlib import Path
 from sacred import Experiment
 from sacred.observers import FileStorageObserver
 from sacred.run import Run
+from sacred.serializer import restore
 from sacred.utils import apply_backspaces_and_linefeeds
 from tensorflow.keras.callbacks import History
 from texts.models import Trigger
-from typing import Callable
 
+from ...corpus import base_vocab, load_corpus, prepare_corpus, tokenize
+from ...nlu_models import TextEncoder
 
 name = "computer-nn"
 ex = Experiment(name)
@@ -69,22 +75,35 @@ def build(
     num_intents: int,
     num_languages: int,
     adamw: dict,
+    pooling: str,
     _log: Logger,
 ) -> Model:
-    """Build model."""
+    """Build model.
+
+    With `pooling="average"` the NLU model averages over the positions of the text
+    instead of flattening them and takes inputs of any length up to the context
+    size. Padding positions are zeroed after every layer, so predictions do not
+    depend on the padded length.
+    """
     _log.info("Build nn-model.")
 
-    texts = Input((context_size,), name="text")
+    texts = Input((context_size if pooling == "flatten" else None,), name="text")
 
     x = Embedding(input_dim=vocab_size, output_dim=embedding_size, mask_zero=True)(
         texts
     )
+    mask = None
+    if pooling == "average":
+        mask = ops.expand_dims(ops.cast(ops.not_equal(texts, 0), x.dtype), -1)
+        x = x * mask
     x = SpatialDropout1D(rate=dropout_rate)(x)
 
     tensors = [x]
     for i in range(math.ceil(context_size / 10)):
         x = Concatenate()(tensors)
         x = Conv1D(num_filters, kernel_size, padding="same", activation=activation)(x)
+        if mask is not None:
+            x = x * mask
         x = SpatialDropout1D(rate=dropout_rate)(x)
         tensors.append(x)
 
@@ -100,30 +119,43 @@ def build(
     # Language Model
     texts = Input((context_size,), name="text")
     x = inner_model(texts)
-    x = Conv1D(vocab_size, 1, padding="same", activation="sigmoid", name="next")(
-        x["vec"]
-    )
+    # outputs stay float32 under a mixed precision policy
+    x = Conv1D(
+        vocab_size,
+        1,
+        padding="same",
+        activation="softmax",
+        dtype="float32",
+        name="next",
+    )(x["vec"])
 
     language_model = Model({"text": texts}, {"next": x}, name="language_model")
     language_model.compile(
         loss={
-            "next": "mse",
+            "next": "sparse_categorical_crossentropy",
         },
-        metrics={
-            "next": ["accuracy", "precision", "recall"],
+        weighted_metrics={
+            "next": ["sparse_categorical_accuracy"],
         },
         optimizer=AdamW(**adamw),
     )
     language_model.summary()
 
     # NLU model
-    texts = Input((context_size,), name="text")
+    texts = Input((context_size if pooling == "flatten" else None,), name="text")
     inner_model.trainable = False
     x = inner_model(texts)
-    x = Flatten()(x["vec"])
+    if pooling == "average":
+        x = GlobalAveragePooling1D()(x["vec"], mask=ops.not_equal(texts, 0))
+    else:
+        x = Flatten()(x["vec"])
 
-    intents = Dense(num_intents, activation="softmax", name="intent")(x)
-    languages = Dense(num_languages, activation="softmax", name="language")(x)
+    intents = Dense(num_intents, activation="softmax", dtype="float32", name="intent")(
+        x
+    )
+    languages = Dense(
+        num_languages, activation="softmax", dtype="float32", name="language"
+    )(x)
 
     nlu_model = Model(
         {"text": texts}, {"intent": intents, "language": languages}, name="computer"
@@ -146,58 +178,155 @@ def build(
 @ex.capture
 def train(
     model: Model,
-    train_gen: PyDataset,
+    train_gen: PyDataset | tf.data.Dataset,
+    num_samples: int,
     batch_size: int,
     epochs: int,
     earlystopping: dict,
     reducelronplateau: dict,
+    checkpoint_every: int,
+    resume: str | None,
     _log: Logger,
     _run: Run,
 ) -> History:
-    """Train model."""
+    """Train model.
+
+    The model is checkpointed to the checkpoints directory of the run. With `resume`
+    training continues from the checkpoint of the model in that directory.
+    """
     _log.info("Train model.")
     callbacks = [
+        Throughput(num_samples),
         SacredMetricsLogging(_run),
     ]
     callbacks.append(EarlyStopping(**earlystopping))
     callbacks.append(ReduceLROnPlateau(**reducelronplateau))
-    return model.fit(
-        train_gen,
-        batch_size=batch_size,
-        epochs=epochs,
-        callbacks=callbacks,
+    # must be the last callback, it restores the states of the others
+    checkpoint = Checkpoint(
+        Path(_run.observers[0].dir) / "checkpoints" / model.name,
+        callbacks,
+        checkpoint_every,
     )
+    callbacks.append(checkpoint)
 
+    if resume is not None and checkpoint.load(model, Path(resume) / model.name):
+        _log.info(f"Resume {model.name} from epoch {checkpoint.epoch}.")
+    if checkpoint.completed:
+        _log.info(f"Training of {model.name} already completed.")
+        checkpoint.set_model(model)
+        checkpoint.save()
+        history = History()
+    else:
+        history = model.fit(
+            train_gen,
+            batch_size=batch_size,
+            epochs=epochs,
+            callbacks=callbacks,
+            initial_epoch=checkpoint.epoch,
+        )
+    history.epoch = list(range(checkpoint.epoch))
+    history.history = checkpoint.history
+    return history
 
-@ex.main
-def run(texts, batch_size: int, context_size: int, _log: Logger, _run: Run):
-    """Run sacred experiment."""
+
+@ex.capture
+def configure(threads: dict, precision: str, distribute: str, _log: Logger):
+    """Configure TensorFlow threads and precision policy, returns the strategy.
+
+    Must be called before TensorFlow runs any operation.
+    """
+    try:
+        tf.config.threading.set_inter_op_parallelism_threads(threads["inter_op"])
+        tf.config.threading.set_intra_op_parallelism_threads(threads["intra_op"])
+    except RuntimeError as e:
+        _log.warning(f"Could not set number of threads: {e}")
+    _log.info(
+        "Threads: "
+        + f"{tf.config.threading.get_inter_op_parallelism_threads()} inter op, "
+        + f"{tf.config.threading.get_intra_op_parallelism_threads()} intra op "
+        + "(0 = TensorFlow default)."
+    )
+
+    mixed_precision.set_global_policy(precision)
+    _log.info(f"Precision policy: {precision}.")
+
+    if distribute == "mirrored":
+        strategy = tf.distribute.MirroredStrategy()
+    elif distribute == "multi_worker":
+        strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    else:
+        strategy = tf.distribute.get_strategy()
+    _log.info(
+        f"Distribution strategy: {strategy.__class__.__name__} with "
+        + f"{strategy.num_replicas_in_sync} replicas."
+    )
+    return strategy
+
+
+@ex.capture
+def datasets(
+    texts,
+    batch_size: int,
+    context_size: int,
+    cache_dir: str | None,
+    workers: int,
+    buckets: list[int] | None,
+    _log: Logger,
+) -> tuple["TextPyDataset", "IntentPyDataset"]:
+    """Build datasets."""
     _log.info("Build datasets.")
-    text_train_gen = TextPyDataset(texts, batch_size, context_size, _log)
+    text_train_gen = TextPyDataset(
+        texts, batch_size, context_size, _log, cache_dir, workers
+    )
     vocab_size = len(text_train_gen.vocab) + 1
     _log.info(
-        f"Loaded {len(text_train_gen.data)} examples in {len(text_train_gen)} batches."
+        f"Loaded {text_train_gen.num_samples} examples in {len(text_train_gen)} "
+        + "batches."
     )
     _log.info(f"Vocab size: {vocab_size}.")
 
     intent_train_gen = IntentPyDataset(
-        batch_size, context_size, text_train_gen.vocab, _log
+        batch_size, context_size, text_train_gen.vocab, _log, buckets
     )
     _log.info(
-        f"Loaded {len(intent_train_gen.triggers)} triggers in "
+        f"Loaded {intent_train_gen.num_samples} triggers in "
         + f"{len(intent_train_gen)} batches."
     )
     _log.info(f"Number of intents: {len(intent_train_gen.mappings['intents'])}.")
     _log.info(f"Number of languages: {len(intent_train_gen.mappings['languages'])}.")
+    return text_train_gen, intent_train_gen
 
-    inner_model, language_model, nlu_model = build(
-        vocab_size=vocab_size,
-        num_intents=len(intent_train_gen.mappings["intents"]),
-        num_languages=len(intent_train_gen.mappings["languages"]),
-    )
 
-    language_model_history = train(language_model, text_train_gen)
-    nlu_model_history = train(nlu_model, intent_train_gen)
+@ex.capture
+def input_pipeline(
+    gen: "TextPyDataset | IntentPyDataset", input_pipeline: str, tfdata: dict
+) -> PyDataset | tf.data.Dataset:
+    """Training data of a dataset for the selected input pipeline."""
+    if input_pipeline == "tfdata":
+        return gen.tf_dataset(**tfdata)
+    return gen
+
+
+@ex.main
+def run(context_size: int, pooling: str, _log: Logger, _run: Run):
+    """Run sacred experiment."""
+    strategy = configure()
+    text_train_gen, intent_train_gen = datasets()
+    vocab_size = len(text_train_gen.vocab) + 1
+
+    with strategy.scope():
+        inner_model, language_model, nlu_model = build(
+            vocab_size=vocab_size,
+            num_intents=len(intent_train_gen.mappings["intents"]),
+            num_languages=len(intent_train_gen.mappings["languages"]),
+        )
+
+    language_model_history = train(
+        language_model, input_pipeline(text_train_gen), text_train_gen.num_samples
+    )
+    nlu_model_history = train(
+        nlu_model, input_pipeline(intent_train_gen), intent_train_gen.num_samples
+    )
 
     _log.info("Save experiment")
     _run.observers[0].save_json(language_model_history, "language_model_history.json")
@@ -210,7 +339,8 @@ def run(texts, batch_size: int, context_size: int, _log: Logger, _run: Run):
             "vocab": text_train_gen.vocab,
             "context_size": context_size,
         }
-        | intent_train_gen.mappings,
+        | intent_train_gen.mappings
+        | ({"buckets": intent_train_gen.bounds} if pooling == "average" else {}),
         "mappings.json",
     )
 
@@ -220,6 +350,46 @@ def run(texts, batch_size: int, context_size: int, _log: Logger, _run: Run):
     return results
 
 
+@ex.command
+def benchmark(
+    steps: int, batch_size: int, tfdata: dict, _log: Logger, _run: Run
+) -> dict:
+    """Measure training steps and samples per second of both input pipelines."""
+    strategy = configure()
+    text_train_gen, intent_train_gen = datasets()
+    with strategy.scope():
+        inner_model, language_model, nlu_model = build(
+            vocab_size=len(text_train_gen.vocab) + 1,
+            num_intents=len(intent_train_gen.mappings["intents"]),
+            num_languages=len(intent_train_gen.mappings["languages"]),
+        )
+
+    results = {}
+    for model, gen in [(language_model, text_train_gen), (nlu_model, intent_train_gen)]:
+        for pipeline, data in [
+            ("pydataset", gen),
+            ("tfdata", gen.tf_dataset(**tfdata)),
+        ]:
+            timer = StepTimer()
+            model.fit(
+                data,
+                epochs=1,
+                steps_per_epoch=min(steps + 1, len(gen)),
+                callbacks=[timer],
+                verbose=0,
+            )
+            results[f"{model.name}_{pipeline}"] = timer.steps_per_second
+            results[f"{model.name}_{pipeline}_samples_per_second"] = (
+                timer.steps_per_second * batch_size
+            )
+            _log.info(
+                f"{model.name} with {pipeline}: {timer.steps_per_second:.2f} steps/s, "
+                + f"{timer.steps_per_second * batch_size:.2f} samples/s."
+            )
+    _run.observers[0].save_json(results, "benchmark.json")
+    return results
+
+
 class SacredMetricsLogging(Callback):
     """Sacred metrics logging callback."""
 
@@ -235,8 +405,171 @@ class SacredMetricsLogging(Callback):
                 self.run.log_scalar(k, v, epoch)
 
 
+class Checkpoint(Callback):
+    """Checkpoint callback.
+
+    Saves weights and optimizer state of the model to `{path}.weights.h5` and epoch,
+    history and the states of the given callbacks to `{path}.json`, every `every`
+    epochs and when training ends.
+    """
+
+    STATE_ATTRIBUTES = [
+        "wait",
+        "best",
+        "best_epoch",
+        "stopped_epoch",
+        "cooldown_counter",
+    ]
+
+    def __init__(self, path: Path, callbacks: list[Callback], every: int = 1):
+        """Init."""
+        super().__init__()
+        self.path = path
+        self.callbacks = callbacks
+        self.every = every
+        self.epoch = 0
+        self.completed = False
+        self.history: dict[str, list[float]] = {}
+        self.states: dict[str, dict] = {}
+
+    def load(self, model: Model, path: Path) -> bool:
+        """Load a checkpoint into the model, returns `False` if there is none."""
+        if not path.with_suffix(".json").exists():
+            return False
+        with open(path.with_suffix(".json"), "r", encoding="utf8") as f:
+            state = json.loads(f.read())
+        # optimizer variables are only restored if it is built
+        with model.distribute_strategy.scope():
+            model.optimizer.build(model.trainable_variables)
+        model.load_weights(path.with_suffix(".weights.h5"))
+        self.epoch = state["epoch"]
+        self.completed = state["completed"]
+        self.history = state["history"]
+        self.states = state["callbacks"]
+        return True
+
+    def save(self):
+        """Save a checkpoint of the model."""
+        self.states = {
+            callback.__class__.__name__: {
+                k: (
+                    getattr(callback, k).item()
+                    if hasattr(getattr(callback, k), "item")
+                    else getattr(callback, k)
+                )
+                for k in self.STATE_ATTRIBUTES
+                if hasattr(callback, k)
+            }
+            for callback in self.callbacks
+            if callback is not self
+            and any(hasattr(callback, k) for k in self.STATE_ATTRIBUTES)
+        }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model.save_weights(self.path.with_suffix(".tmp.weights.h5"))
+        os.replace(
+            self.path.with_suffix(".tmp.weights.h5"),
+            self.path.with_suffix(".weights.h5"),
+        )
+        with open(self.path.with_suffix(".tmp.json"), "w", encoding="utf8") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "epoch": self.epoch,
+                        "completed": self.completed,
+                        "history": self.history,
+                        "callbacks": self.states,
+                    }
+                )
+            )
+        os.replace(self.path.with_suffix(".tmp.json"), self.path.with_suffix(".json"))
+
+    def on_train_begin(self, logs: dict | None = None):
+        """On train begin."""
+        for callback in self.callbacks:
+            for k, v in self.states.get(callback.__class__.__name__, {}).items():
+                setattr(callback, k, v)
+
+    def on_epoch_end(self, epoch: int, logs: dict | None = None):
+        """On epoch end."""
+        self.epoch = epoch + 1
+        for k, v in (logs or {}).items():
+            self.history.setdefault(k, []).append(float(v))
+        if self.epoch % self.every == 0:
+            self.save()
+
+    def on_train_end(self, logs: dict | None = None):
+        """On train end."""
+        self.completed = True
+        self.save()
+
+
+class Throughput(Callback):
+    """Add the samples per second of every epoch to the logs."""
+
+    def __init__(self, num_samples: int):
+        """Init."""
+        super().__init__()
+        self.num_samples = num_samples
+        self.start = 0.0
+
+    def on_epoch_begin(self, epoch: int, logs: dict | None = None):
+        """On epoch begin."""
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch: int, logs: dict | None = None):
+        """On epoch end."""
+        if logs is not None:
+            logs["samples_per_second"] = self.num_samples / (
+                time.perf_counter() - self.start
+            )
+
+
+class StepTimer(Callback):
+    """Measure training steps per second, the first step is not counted."""
+
+    def __init__(self):
+        """Init."""
+        super().__init__()
+        self.times: list[float] = []
+
+    def on_train_batch_end(self, batch: int, logs: dict | None = None):
+        """On train batch end."""
+        self.times.append(time.perf_counter())
+
+    @property
+    def steps_per_second(self) -> float:
+        """Steps per second after the first step."""
+        if len(self.times) < 2:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+
+def shuffled_range(n: int, shuffle_buffer: int | None = None) -> tf.data.Dataset:
+    """The ids `0, ..., n - 1` in a new random order every time it is iterated.
+
+    Without `shuffle_buffer` every iteration draws a permutation of all ids, which
+    only needs four or eight bytes per id and does not wait for a buffer to fill.
+    Otherwise the ids are shuffled in a buffer of that size.
+    """
+    if shuffle_buffer is not None:
+        return tf.data.Dataset.range(n).shuffle(shuffle_buffer)
+    dtype = tf.int32 if n < 2**31 else tf.int64
+    return tf.data.Dataset.range(1).flat_map(
+        lambda _: tf.data.Dataset.from_tensor_slices(
+            tf.random.shuffle(tf.range(n, dtype=dtype))
+        )
+    )
+
+
 class IntentPyDataset(PyDataset):
-    """Text pydataset."""
+    """Intent pydataset.
+
+    All triggers are loaded with a single query and encoded into one array, a batch
+    is a slice of it with one-hot encoded labels. With `buckets` triggers are
+    grouped by length and every batch only holds triggers of one bucket, padded to
+    the bound of that bucket instead of the context size.
+    """
 
     def __init__(
         self,
@@ -244,6 +577,7 @@ class IntentPyDataset(PyDataset):
         context_size: int,
         vocab: dict[str, int],
         _log: Logger,
+        buckets: list[int] | None = None,
         **kwargs,
     ):
         """Init."""
@@ -251,57 +585,42 @@ class IntentPyDataset(PyDataset):
         self.batch_size = batch_size
         self.context_size = context_size
         self.vocab = vocab
+        self.bounds = sorted(b for b in set(buckets or []) if b < context_size) + [
+            context_size
+        ]
 
         _log.info(_("Generating data from triggers."))
-        entities: dict[str, dict[str, int] | None] = {}
-        self.intents = []
-        self.languages = []
-        progbar = Progbar(Trigger.objects.count(), width=30)
         self.mappings = {
             "intents": {"null": 0},
             "languages": {"null": 0},
         }
-        self.triggers = []
-        for trigger in Trigger.objects.all():
-            if trigger.intent.name not in self.mappings["intents"]:
-                self.mappings["intents"][trigger.intent.name] = len(
-                    self.mappings["intents"].keys()
+        texts = []
+        intents = []
+        languages = []
+        for text, intent, language in Trigger.objects.order_by(
+            "language", "pk"
+        ).values_list("text", "intent__name", "language"):
+            texts.append(text)
+            intents.append(
+                self.mappings["intents"].setdefault(
+                    intent, len(self.mappings["intents"])
                 )
-            if trigger.language not in self.mappings["languages"]:
-                self.mappings["languages"][trigger.language] = len(
-                    self.mappings["languages"].keys()
-                )
-            for triggerentity in trigger.entities.all():
-                entity = triggerentity.entity
-                parent = triggerentity.entity.parent
-                if parent is None:
-                    if entity.name not in entities:
-                        entities[entity.name] = None
-                else:
-                    if parent.name not in entities:
-                        entities[parent.name] = {entity.name: 0}
-                    elif entity.name not in entities[parent.name]:
-                        entities[parent.name][entity.name] = len(
-                            entities[parent.name].keys()
-                        )
-            self.triggers.append([self.vocab["<begin of sequence>"]])
-            self.triggers[-1] += [
-                (
-                    self.vocab[j]
-                    if j in self.vocab.keys()
-                    else self.vocab["<fallback character>"]
+            )
+            languages.append(
+                self.mappings["languages"].setdefault(
+                    language, len(self.mappings["languages"])
                 )
-                for j in trigger.text
-            ]
-            self.triggers[-1].append(self.vocab["<end of sequence>"])
-            self.languages.append(self.mappings["languages"][trigger.language])
-            self.intents.append(self.mappings["intents"][trigger.intent.name])
-            progbar.add(1)
-        self.indices = np.asarray(list(range(len(self.triggers))), dtype=np.int32)
+            )
+        self.texts = TextEncoder(self.vocab, self.context_size).encode(texts)
+        self.num_samples = len(self.texts)
+        self.intents = np.asarray(intents, dtype=np.int32)
+        self.languages = np.asarray(languages, dtype=np.int32)
+        self.buckets = np.searchsorted(self.bounds, (self.texts != 0).sum(axis=1))
+        self.batches = self._batches(shuffle=False)
 
     def __len__(self) -> int:
         """Get the number of batches in the PyDataset."""
-        return math.ceil(len(self.triggers) / self.batch_size)
+        return len(self.batches)
 
     def __getitem__(
         self, idx: int
@@ -312,49 +631,107 @@ class IntentPyDataset(PyDataset):
                 _("Index %(idx)d out of range for %(class)s with size %(size)d.")
                 % {"idx": idx, "class": self.__class__.__name__, "size": len(self)}
             )
-        low = idx * self.batch_size
-        high = min(low + self.batch_size, len(self.triggers))
-        batch_texts = np.zeros(
-            (min(self.batch_size, high - low), self.context_size), dtype=np.int32
-        )
-        batch_languages = np.zeros(
-            (min(self.batch_size, high - low), len(self.mappings["languages"])),
-            dtype=np.int32,
-        )
-        batch_intents = np.zeros(
-            (min(self.batch_size, high - low), len(self.mappings["intents"])),
-            dtype=np.int32,
-        )
+        bucket, batch = self.batches[idx]
+        return {"text": self.texts[batch, : self.bounds[bucket]]}, {
+            "intent": np.eye(len(self.mappings["intents"]), dtype=np.int32)[
+                self.intents[batch]
+            ],
+            "language": np.eye(len(self.mappings["languages"]), dtype=np.int32)[
+                self.languages[batch]
+            ],
+        }
+
+    def on_epoch_begin(self):
+        """At the beginning of every epoch called."""
+        self.batches = self._batches(shuffle=True)
 
-        i = 0
-        for j in self.indices[low:high]:
-            for k in range(len(self.triggers[j])):
-                batch_texts[i][k] = self.triggers[j][k]
-            batch_languages[i] = to_categorical(
-                [self.languages[j]], len(self.mappings["languages"])
+    def _batches(self, shuffle: bool) -> list[tuple[int, npt.NDArray]]:
+        """Bucket and sample ids of every batch.
+
+        Unshuffled, the buckets take turns, Keras infers the input shape from the
+        first batches and so sees that the length varies.
+        """
+        bucket_batches = []
+        for bucket in range(len(self.bounds)):
+            samples = np.flatnonzero(self.buckets == bucket)
+            if shuffle:
+                samples = np.random.permutation(samples)
+            bucket_batches.append(
+                [
+                    (bucket, samples[i : i + self.batch_size])
+                    for i in range(0, len(samples), self.batch_size)
+                ]
             )
-            batch_intents[i] = to_categorical(
-                [self.intents[j]], len(self.mappings["intents"])
+        batches = [
+            batch
+            for batches in itertools.zip_longest(*bucket_batches)
+            for batch in batches
+            if batch is not None
+        ]
+        if shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return batches
+
+    def tf_dataset(
+        self, shuffle_buffer: int | None = None, cache: str | None = None
+    ) -> tf.data.Dataset:
+        """The triggers as shuffled, batched and prefetched `tf.data.Dataset`.
+
+        Labels are one-hot encoded on the batch. All triggers are in memory anyway, so
+        `cache` is ignored.
+        """
+        texts = tf.constant(self.texts)
+        intents = tf.constant(self.intents)
+        languages = tf.constant(self.languages)
+        dataset = shuffled_range(self.num_samples, shuffle_buffer).map(
+            lambda i: (
+                tf.gather(texts, i),
+                tf.gather(intents, i),
+                tf.gather(languages, i),
+            )
+        )
+        if len(self.bounds) > 1:
+            dataset = dataset.bucket_by_sequence_length(
+                lambda text, intent, language: tf.math.count_nonzero(
+                    text, dtype=tf.int32
+                ),
+                [bound + 1 for bound in self.bounds[:-1]],
+                [self.batch_size] * len(self.bounds),
             )
-            i += 1
+        else:
+            dataset = dataset.batch(self.batch_size)
+        return dataset.map(
+            self._tf_batch, num_parallel_calls=tf.data.AUTOTUNE
+        ).prefetch(tf.data.AUTOTUNE)
 
-        return {"text": batch_texts}, {
-            "intent": batch_intents,
-            "language": batch_languages,
+    def _tf_batch(
+        self, text: tf.Tensor, intent: tf.Tensor, language: tf.Tensor
+    ) -> tuple[dict[str, tf.Tensor], dict[str, tf.Tensor]]:
+        bounds = tf.constant(self.bounds, dtype=tf.int32)
+        length = tf.reduce_max(tf.math.count_nonzero(text, axis=1, dtype=tf.int32))
+        bound = bounds[tf.searchsorted(bounds, [length])[0]]
+        return {"text": text[:, :bound]}, {
+            "intent": tf.one_hot(intent, len(self.mappings["intents"]), dtype=tf.int32),
+            "language": tf.one_hot(
+                language, len(self.mappings["languages"]), dtype=tf.int32
+            ),
         }
 
-    def on_epoch_begin(self):
-        """At the beginning of every epoch called."""
-        self.indices = np.asarray(list(range(len(self.triggers))), dtype=np.int32)
-        np.random.shuffle(self.indices)
-
     def on_epoch_end(self):
         """At the end of every epoch called."""
         pass
 
 
 class TextPyDataset(PyDataset):
-    """Text pydataset."""
+    """Text pydataset.
+
+    The corpus is stored as one flat token array, every text wrapped in begin and
+    end of sequence symbols, together with the offsets of the texts. A sample is
+    the window of up to `context_size` tokens ending at a position of a text, it is
+    cut from the token array only when its batch is requested. If `cache_dir` is
+    given the tokenized corpus is loaded from there memory-mapped, it is created
+    first if it does not exist yet.
+    """
 
     def __init__(
         self,
@@ -362,6 +739,8 @@ class TextPyDataset(PyDataset):
         batch_size: int,
         context_size: int,
         _log: Logger,
+        cache_dir: Path | str | None = None,
+        workers: int = 1,
         **kwargs,
     ):
         """Init."""
@@ -369,106 +748,109 @@ class TextPyDataset(PyDataset):
         self.batch_size = batch_size
         self.context_size = context_size
 
-        self.vocab = {
-            "<begin of sequence>": 1,
-            "<end of sequence>": 2,
-            "<fallback character>": 3,
-        } | {
-            k: i + 4
-            for i, k in enumerate(
-                [" "]
-                + sorted(list(string.ascii_letters), key=lambda x: x.lower())
-                + list(string.digits + string.punctuation)
+        if cache_dir is None:
+            self.tokens, self.offsets, self.vocab = tokenize(
+                paths, base_vocab(), context_size, _log, workers
+            )
+        else:
+            self.tokens, self.offsets, self.vocab = load_corpus(
+                prepare_corpus(paths, cache_dir, context_size, _log, workers)
             )
-        }
 
-        _log.info(_("Loading texts from files."))
-        self.data: list[tuple[list[int], list[int]]] = []
-        progbar = Progbar(len(paths), width=30)
-        for p in paths:
-            if isinstance(p, str):
-                p = Path(p)
-
-            fopen: Callable = open
-            if p.suffix == ".gz":
-                fopen = gzip.open
-
-            texts = []
-            with fopen(p, "rt", encoding="utf8") as f:
-                if p.suffix == ".json":
-                    data = json.loads(f.read())
-                    if "title" in data.keys():
-                        texts.append(data["title"])
-                    if "lead" in data.keys():
-                        texts.append(data["lead"])
-                    if "text" in data.keys():
-                        texts.append(data["text"])
-                else:
-                    texts.append(f.read().strip())
-            for text in texts:
-                for i in range(1, len(text) + 2):
-                    start = (
-                        0 if i <= (self.context_size - 1) else i - (self.context_size)
-                    )
-                    self.data.append(
-                        (
-                            ([1] if i <= (self.context_size - 1) else [])
-                            + [
-                                self.vocab.setdefault(j, len(self.vocab) + 1)
-                                for j in text[start:i]
-                            ]
-                            + ([2] if i > len(text) else []),
-                            [
-                                self.vocab.setdefault(j, len(self.vocab) + 1)
-                                for j in text[
-                                    start
-                                    + (0 if i <= (self.context_size - 1) else 1) : i
-                                    + (1 if i <= len(text) else 0)
-                                ]
-                            ]
-                            + ([2] if i + 1 > len(text) else []),
-                        )
-                    )
-            progbar.add(1)
-        self.indices = np.asarray(list(range(len(self.data))), dtype=np.int32)
+        # a text of n tokens has n - 1 samples, one ending at every token but the
+        # begin of sequence
+        self.sample_offsets = np.zeros(len(self.offsets), dtype=np.int64)
+        np.cumsum(np.maximum(np.diff(self.offsets) - 1, 0), out=self.sample_offsets[1:])
+        self.num_samples = int(self.sample_offsets[-1])
+        self.windows = sliding_window_view(self.tokens, self.context_size + 1)
+        self.indices = np.arange(self.num_samples)
 
     def __len__(self) -> int:
         """Get the number of batches in the PyDataset."""
-        return math.ceil(len(self.data) / self.batch_size)
+        return math.ceil(self.num_samples / self.batch_size)
 
     def __getitem__(
         self, idx: int
-    ) -> tuple[dict[str, npt.NDArray], dict[str, npt.NDArray]]:
-        """Get the batch at position `index`."""
+    ) -> tuple[dict[str, npt.NDArray], dict[str, npt.NDArray], dict[str, npt.NDArray]]:
+        """Get the batch at position `index`.
+
+        Targets are the ids of the next tokens, positions without a target have a
+        sample weight of zero.
+        """
         if idx < 0 or len(self) <= idx:
             raise IndexError(
                 _("Index %(idx)d out of range for %(class)s with size %(size)d.")
                 % {"idx": idx, "class": self.__class__.__name__, "size": len(self)}
             )
         low = idx * self.batch_size
-        high = min(low + self.batch_size, len(self.data))
-        batch_text = np.zeros(
-            (min(self.batch_size, high - low), self.context_size), dtype=np.int32
-        )
-        batch_next = np.zeros(
-            (min(self.batch_size, high - low), self.context_size, len(self.vocab) + 1),
-            dtype=np.int32,
+        high = min(low + self.batch_size, self.num_samples)
+        batch_text, batch_next = self._windows(self.indices[low:high])
+        return (
+            {"text": batch_text},
+            {"next": batch_next},
+            {"next": (batch_next != 0).astype(np.float32)},
         )
 
-        i = 0
-        for j in self.indices[low:high]:
-            for k in range(len(self.data[j][0])):
-                batch_text[i][k] = self.data[j][0][k]
-            for k in range(len(self.data[j][1])):
-                batch_next[i][k][self.data[j][1][k]] = 1
-            i += 1
+    def _windows(self, samples: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+        """Input and target windows of the given samples.
 
-        return {"text": batch_text}, {"next": batch_next}
+        Positions after the end of a window are zero, in the target window the last
+        position of a text has no target.
+        """
+        doc = np.searchsorted(self.sample_offsets, samples, side="right") - 1
+        doc_start = self.offsets[doc]
+        doc_end = self.offsets[doc + 1]
+        end = doc_start + 1 + samples - self.sample_offsets[doc]
+        start = np.maximum(doc_start, end - self.context_size + 1)
+
+        windows = self.windows[start]
+        positions = np.arange(self.context_size)
+        batch_text = np.where(
+            positions < (end - start + 1)[:, np.newaxis], windows[:, :-1], 0
+        )
+        batch_next = np.where(
+            positions < (np.minimum(end + 2, doc_end) - start - 1)[:, np.newaxis],
+            windows[:, 1:],
+            0,
+        )
+        return batch_text.astype(np.int32), batch_next.astype(np.int32)
 
     def on_epoch_begin(self):
         """Method called at the beginning of every epoch."""
-        self.indices = np.asarray(list(range(len(self.data))), dtype=np.int32)
-        np.random.shuffle(self.indices)
+        self.indices = np.random.permutation(self.num_samples)
+
+    def tf_dataset(
+        self, shuffle_buffer: int | None = None, cache: str | None = None
+    ) -> tf.data.Dataset:
+        """The samples as shuffled, batched and prefetched `tf.data.Dataset`.
+
+        Sample ids are shuffled and batched, the windows of a batch are cut in one
+        vectorized call. With `cache` the batches are cached, in memory if it is
+        empty otherwise in that file, and only their order is shuffled after the
+        first epoch.
+        """
+        dataset = (
+            shuffled_range(self.num_samples, shuffle_buffer)
+            .batch(self.batch_size)
+            .map(self._tf_windows, num_parallel_calls=tf.data.AUTOTUNE)
+        )
+        if cache is not None:
+            dataset = dataset.cache(cache).shuffle(len(self))
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def _tf_windows(
+        self, samples: tf.Tensor
+    ) -> tuple[dict[str, tf.Tensor], dict[str, tf.Tensor], dict[str, tf.Tensor]]:
+        batch_text, batch_next = tf.numpy_function(
+            self._windows, [samples], [tf.int32, tf.int32], stateful=False
+        )
+        batch_text.set_shape((None, self.context_size))
+        batch_next.set_shape((None, self.context_size))
+        return (
+            {"text": batch_text},
+            {"next": batch_next},
+            {"next": tf.cast(batch_next != 0, tf.float32)},
+        )
 
 
 class Command(BaseCommand):
@@ -487,6 +869,121 @@ class Command(BaseCommand):
             nargs="+",
             type=lambda p: Path(p).absolute(),
         )
+        parser.add_argument(
+            "--cache-dir",
+            type=lambda p: Path(p).absolute(),
+            help=_(
+                "Directory of tokenized corpora, see the prepare command. The "
+                + "corpus is tokenized into it if needed."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            default=os.cpu_count(),
+            type=int,
+            help=_("Number of processes reading and tokenizing the text files."),
+        )
+        parser.add_argument(
+            "--context-size",
+            default=100,
+            type=int,
+        )
+        parser.add_argument(
+            "--input-pipeline",
+            choices=["pydataset", "tfdata"],
+            default="pydataset",
+        )
+        parser.add_argument(
+            "--shuffle-buffer",
+            type=int,
+            help=_(
+                "Shuffle buffer of the tfdata pipeline, by default the samples are "
+                + "permuted every epoch."
+            ),
+        )
+        parser.add_argument(
+            "--tfdata-cache",
+            nargs="?",
+            const="",
+            help=_(
+                "Cache the batches of the tfdata pipeline, in memory or in the given "
+                + "file."
+            ),
+        )
+        parser.add_argument(
+            "--benchmark",
+            type=int,
+            metavar="STEPS",
+            help=_(
+                "Instead of training, report the training steps per second of both "
+                + "input pipelines over the given number of steps."
+            ),
+        )
+        parser.add_argument(
+            "--checkpoint-every",
+            default=1,
+            type=int,
+            metavar="EPOCHS",
+            help=_("Checkpoint the models every given number of epochs."),
+        )
+        parser.add_argument(
+            "--resume",
+            type=lambda p: Path(p).absolute(),
+            metavar="RUN_DIR",
+            help=_(
+                "Continue a run from its last checkpoints, with its configuration, "
+                + "in a new run."
+            ),
+        )
+        parser.add_argument(
+            "--inter-op-threads",
+            default=0,
+            type=int,
+            help=_("Threads running independent operations, 0 for the default."),
+        )
+        parser.add_argument(
+            "--intra-op-threads",
+            default=0,
+            type=int,
+            help=_("Threads within a single operation, 0 for the default."),
+        )
+        parser.add_argument(
+            "--precision",
+            choices=["float32", "mixed_bfloat16", "mixed_float16"],
+            default="float32",
+            help=_(
+                "Precision policy, mixed_bfloat16 is fast on CPUs with AVX512-BF16 "
+                + "or AMX and mixed_float16 on GPUs."
+            ),
+        )
+        parser.add_argument(
+            "--distribute",
+            choices=["none", "mirrored", "multi_worker"],
+            default="none",
+            help=_(
+                "Distribution strategy, multi_worker reads the cluster from "
+                + "TF_CONFIG."
+            ),
+        )
+        parser.add_argument(
+            "--pooling",
+            choices=["flatten", "average"],
+            default="flatten",
+            help=_(
+                "How the NLU model reduces the positions of the text, average "
+                + "accepts inputs shorter than the context size."
+            ),
+        )
+        parser.add_argument(
+            "--buckets",
+            nargs="+",
+            type=int,
+            metavar="LENGTH",
+            help=_(
+                "Batch triggers by length, padded to the given bounds instead of "
+                + "the context size. Needs average pooling."
+            ),
+        )
         parser.add_argument(
             "--batch-size",
             default=128,
@@ -516,10 +1013,22 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         """Handle command."""
         ex.observers.append(FileStorageObserver(options["SACRED_BASEDIR"]))
-        ex.add_config(
+        ex.add_config(self.config(options))
+        if options["benchmark"]:
+            ex.run("benchmark")
+        else:
+            ex.run()
+
+    def config(self, options: dict) -> dict:
+        """Sacred config from the command options."""
+        if options["buckets"] and options["pooling"] != "average":
+            raise CommandError(_("Length buckets need average pooling."))
+        if options["benchmark"] and options["resume"] is not None:
+            raise CommandError(_("A resumed run can not be benchmarked."))
+        config = dict(
             batch_size=options["batch_size"],
             epochs=options["epochs"],
-            context_size=100,
+            context_size=options["context_size"],
             embedding_size=options["embedding_size"],
             dropout_rate=options["dropout_rate"],
             units=options["units"],
@@ -540,5 +1049,30 @@ class Command(BaseCommand):
             },
             adamw={"amsgrad": True},
             texts=options["text_data"],
+            cache_dir=(
+                None if options["cache_dir"] is None else str(options["cache_dir"])
+            ),
+            workers=options["workers"],
+            input_pipeline=options["input_pipeline"],
+            tfdata={
+                "shuffle_buffer": options["shuffle_buffer"],
+                "cache": options["tfdata_cache"],
+            },
+            steps=options["benchmark"],
+            checkpoint_every=options["checkpoint_every"],
+            threads={
+                "inter_op": options["inter_op_threads"],
+                "intra_op": options["intra_op_threads"],
+            },
+            precision=options["precision"],
+            distribute=options["distribute"],
+            pooling=options["pooling"],
+            buckets=options["buckets"],
+            resume=None,
         )
-        ex.run()
+        if options["resume"] is not None:
+            # options added later default to the values given now
+            with open(options["resume"] / "config.json", "r", encoding="utf8") as f:
+                config |= restore(json.loads(f.read()))
+            config["resume"] = str(options["resume"] / "checkpoints")
+        return config
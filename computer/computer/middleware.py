@@ -18,21 +18,50 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app middleware module."""
 
-
-import pytz
-
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
+from functools import lru_cache
+from profiles.models import Profile
+from zoneinfo import ZoneInfo
+
+
+@lru_cache
+def get_timezone(name: str) -> ZoneInfo:
+    """Timezone object for a timezone name."""
+    return ZoneInfo(name)
+
+
+def timezone_cache_key(user_id: int) -> str:
+    """Cache key of the timezone of a user."""
+    return "computer:timezone:%d" % user_id
 
 
 class TimezoneMiddleware(MiddlewareMixin):
-    """Timezone middleware."""
+    """Timezone middleware.
+
+    The timezone name from the profile preferences is kept in the default cache per
+    user for `settings.TIMEZONE_CACHE["ttl"]` seconds, `computer.signals` deletes it
+    whenever a profile changes. Unless the cache is shared, other processes see a
+    change only once their entry expired.
+    """
 
     def process_request(self, request):
         """Process request."""
         timezone.deactivate()
         if request.user.is_authenticated:
-            if "timezone" in request.user.profile.preferences:
-                timezone.activate(
-                    pytz.timezone(request.user.profile.preferences["timezone"])
+            key = timezone_cache_key(request.user.pk)
+            name = cache.get(key)
+            if name is None:
+                preferences = (
+                    Profile.objects.filter(user=request.user)
+                    .values_list("preferences", flat=True)
+                    .first()
+                )
+                name = (preferences or {}).get("timezone", "")
+                cache.set(
+                    key, name, getattr(settings, "TIMEZONE_CACHE", {}).get("ttl", 300)
                 )
+            if name:
+                timezone.activate(get_timezone(name))
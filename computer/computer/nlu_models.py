@@ -18,20 +18,96 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app nlu model module."""
 
-
+import hashlib
 import json
 import numpy as np
 import numpy.typing as npt
+import os
 import re
 import sys
+import threading
+import time
 
+from concurrent.futures import Future
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext_lazy as _
 from tensorflow.keras.models import load_model
+from typing import Iterator
 
+from .backends import load_backend
+from .cache import PredictionCache
 from .utils import Singleton
 
+WHITESPACE_RE = re.compile(r"\s\s+")
+
+
+class TextEncoder:
+    """Table driven text encoder.
+
+    Maps texts to vocab ids through a lookup table indexed by codepoint, which is
+    built once from the vocab. Characters outside the vocab are mapped to the
+    `<fallback character>`.
+    """
+
+    def __init__(self, vocab: dict[str, int], context_size: int):
+        """Init."""
+        self.context_size = context_size
+        self.begin_of_sequence = vocab["<begin of sequence>"]
+        self.end_of_sequence = vocab["<end of sequence>"]
+
+        chars = {ord(k): v for k, v in vocab.items() if len(k) == 1}
+        # the last entry catches every codepoint beyond the largest one in the vocab
+        self.table = np.full(
+            max(chars.keys(), default=0) + 2,
+            vocab["<fallback character>"],
+            dtype=np.int32,
+        )
+        self.table[list(chars.keys())] = list(chars.values())
+
+    def encode(
+        self,
+        texts: list[str],
+        include_end_of_sequence: bool = True,
+        truncation: str = "right",
+    ) -> npt.NDArray[np.int32]:
+        """Encode texts to an int32 array of shape `(len(texts), context_size)`.
+
+        Texts that do not fit into the context together with the begin and end of
+        sequence symbols are truncated, at the end for `truncation="right"` and at
+        the beginning for `truncation="left"`.
+        """
+        if truncation not in ["left", "right"]:
+            raise ValueError(
+                _('Unknown truncation "%(truncation)s".') % {"truncation": truncation}
+            )
+        max_length = self.context_size - (2 if include_end_of_sequence else 1)
+        if max_length < 0:
+            raise ValueError(_("Context size is too small."))
+
+        x = np.zeros((len(texts), self.context_size), dtype=np.int32)
+        if len(texts) == 0:
+            return x
+        x[:, 0] = self.begin_of_sequence
+
+        codepoints = np.frombuffer(
+            "".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        ids = self.table[np.minimum(codepoints, len(self.table) - 1)]
+
+        lengths = np.fromiter((len(text) for text in texts), np.int64, len(texts))
+        keep = np.minimum(lengths, max_length)
+        starts = np.cumsum(lengths) - lengths
+        if truncation == "left":
+            starts += lengths - keep
+
+        rows = np.repeat(np.arange(len(texts)), keep)
+        cols = np.arange(keep.sum()) - np.repeat(np.cumsum(keep) - keep, keep)
+        x[rows, cols + 1] = ids[np.repeat(starts, keep) + cols]
+        if include_end_of_sequence:
+            x[np.arange(len(texts)), keep + 1] = self.end_of_sequence
+        return x
+
 
 class NLUModel(metaclass=Singleton):
     """NLU model."""
@@ -43,6 +119,25 @@ class NLUModel(metaclass=Singleton):
         if "nlu" not in settings.MODELS:
             raise ImproperlyConfigured(_("No nlu model defiend."))
 
+        self._lock = threading.Lock()
+        self._load()
+
+        self.chat_model = None
+        if "chat" in settings.MODELS:
+            try:
+                print(
+                    _('Loading model "%(path)s".')
+                    % {"path": settings.MODELS["chat"]["path"]}
+                )
+                self.chat_model = load_model(
+                    settings.BASE_DIR / settings.MODELS["chat"]["path"]
+                )
+            except Exception as e:
+                print(_("Could not load model."), e, file=sys.stderr)
+
+    def _load(self):
+        """Load nlu model and mappings, this also resets the prediction cache."""
+        self.version = self.fingerprint()
         with open(
             settings.BASE_DIR / settings.MODELS["nlu"]["mappings"],
             "r",
@@ -58,85 +153,244 @@ class NLUModel(metaclass=Singleton):
             self.mappings["rvocab"] = {}
             for k, v in self.mappings["vocab"].items():
                 self.mappings["rvocab"][v] = k
+        self.encoder = TextEncoder(
+            self.mappings["vocab"], self.mappings["context_size"]
+        )
+        self._unknown_re = re.compile(
+            r"[^%s]" % re.escape("".join(self.mappings["vocab"].keys()))
+        )
 
         try:
             print(
                 _('Loading model "%(path)s".')
                 % {"path": settings.MODELS["nlu"]["path"]}
             )
-            self.nlu_model = load_model(
-                settings.BASE_DIR / settings.MODELS["nlu"]["path"]
+            self.nlu_model = load_backend(
+                settings.MODELS["nlu"].get("backend", "keras"),
+                settings.BASE_DIR / settings.MODELS["nlu"]["path"],
+                **settings.MODELS["nlu"].get("backend_options", {}),
             )
         except Exception as e:
             print(_("Could not load model."), e, file=sys.stderr)
             self.nlu_model = None
 
-        self.chat_model = None
-        if "chat" in settings.MODELS:
+        config = settings.MODELS["nlu"].get("cache", {})
+        self.cache = PredictionCache(
+            self.version,
+            config.get("size", 1024),
+            config.get("ttl", 3600.0),
+            config.get("alias"),
+        )
+
+    def fingerprint(self) -> str:
+        """Fingerprint of the nlu model and mappings files on disk."""
+        h = hashlib.sha256()
+        for path in [
+            settings.MODELS["nlu"]["path"],
+            settings.MODELS["nlu"]["mappings"],
+        ]:
             try:
-                print(
-                    _('Loading model "%(path)s".')
-                    % {"path": settings.MODELS["chat"]["path"]}
-                )
-                self.chat_model = load_model(
-                    settings.BASE_DIR / settings.MODELS["chat"]["path"]
-                )
-            except Exception as e:
-                print(_("Could not load model."), e, file=sys.stderr)
+                stat = os.stat(settings.BASE_DIR / path)
+                h.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+            except OSError:
+                h.update(f"{path}:missing;".encode())
+        return h.hexdigest()[:16]
 
-    def _clean_text(self, text):
-        return re.sub(
-            r"[^%s]" % re.escape("".join(self.mappings["vocab"].keys())),
-            self.fallback_symbol,
-            re.sub(r"\s\s+", " ", text),
-        )
+    def reload_if_changed(self):
+        """Reload nlu model and mappings if one of their files changed."""
+        if self.fingerprint() != self.version:
+            with self._lock:
+                if self.fingerprint() != self.version:
+                    self._load()
 
-    def _text_to_np(
-        self, text: str, include_end_of_sequence: bool = True
-    ) -> npt.NDArray:
-        x_text = np.zeros((1, self.mappings["context_size"]))
-        x_text[0, 0] = self.mappings["vocab"]["<begin of sequence>"]
-        i = 0
-        for i, s in enumerate(text):
-            x_text[0, i + 1] = (
-                self.mappings["vocab"][s]
-                if s in self.mappings["vocab"]
-                else self.mappings["vocab"]["<fallback character>"]
-            )
-        if include_end_of_sequence:
-            x_text[0, i + 2] = self.mappings["vocab"]["<end of sequence>"]
-        return x_text
+    def _clean_text(self, text):
+        return self._unknown_re.sub(self.fallback_symbol, WHITESPACE_RE.sub(" ", text))
 
     def predict(self, text):
         """Predict intent."""
-        text = self._clean_text(text)
-        x_text = self._text_to_np(text)
-        outs = self.nlu_model.predict({"text": x_text}, batch_size=1)
-        p = {"entities": {}}
-        for k, v in outs.items():
-            p[k] = {
-                "name": self.mappings["r" + k + "s"][v.argmax()],
-                "p": float(v.max()),
-            }
-        return p
-
-    def chat(self, text: str, context: str | None = None) -> str:
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts: list[str]) -> list[dict]:
+        """Predict intents for several texts with a single forward pass.
+
+        Only texts without a cached prediction are passed to the model.
+        """
+        self.reload_if_changed()
+        texts = [self._clean_text(text) for text in texts]
+        predictions = [self.cache.get(text) for text in texts]
+        missing = [i for i, p in enumerate(predictions) if p is None]
+        if missing:
+            for i, p in zip(missing, self._predict([texts[i] for i in missing])):
+                predictions[i] = p
+        return predictions
+
+    def _predict(self, texts: list[str]) -> list[dict]:
+        x = self.encoder.encode(texts)
+        if "buckets" in self.mappings:
+            outs = self._predict_buckets(x, self.mappings["buckets"])
+        else:
+            outs = self.nlu_model.predict(x)
+        predictions = []
+        for i in range(len(texts)):
+            p: dict[str, dict] = {"entities": {}}
+            for k, v in outs.items():
+                p[k] = {
+                    "name": self.mappings["r" + k + "s"][v[i].argmax()],
+                    "p": float(v[i].max()),
+                }
+            self.cache.set(texts[i], p)
+            predictions.append(p)
+        return predictions
+
+    def _predict_buckets(
+        self, x: npt.NDArray, buckets: list[int]
+    ) -> dict[str, npt.NDArray]:
+        """Predict texts grouped by length bucket, padded to the bound of it."""
+        text_buckets = np.searchsorted(buckets, (x != 0).sum(axis=1))
+        outs: dict[str, npt.NDArray] = {}
+        for bucket in np.unique(text_buckets):
+            rows = np.flatnonzero(text_buckets == bucket)
+            for k, v in self.nlu_model.predict(x[rows, : buckets[bucket]]).items():
+                if k not in outs:
+                    outs[k] = np.zeros((len(x),) + v.shape[1:], dtype=v.dtype)
+                outs[k][rows] = v
+        return outs
+
+    def chat(self, text: str, **kwargs) -> str:
         """Generate text."""
+        return "".join(self.generate(text, **kwargs))
+
+    def generate(
+        self,
+        text: str,
+        max_length: int | None = None,
+        temperature: float | None = None,
+        top_k: int | None = None,
+    ) -> Iterator[str]:
+        """Generate text character by character.
+
+        The input buffer is encoded once and every generated character is written
+        into it, sliding the window once the context is full. Decoding is greedy
+        for a temperature of zero, otherwise the next character is sampled from the
+        `top_k` most likely ones. Stops at `<end of sequence>` or after
+        `max_length` characters. Defaults are read from `settings.MODELS["chat"]`.
+        """
+        config = settings.MODELS["chat"]
+        if max_length is None:
+            max_length = config.get("max_length", 98)
+        if temperature is None:
+            temperature = config.get("temperature", 0.0)
+        if top_k is None:
+            top_k = config.get("top_k")
+
         text = self._clean_text(text)
-        x_text = self._text_to_np(text + ("" if context is None else context), False)
-        outs = self.chat_model.predict({"text": x_text}, batch_size=1)
-        answer_text = [] if context is None else list()
-        done = False
-        for i in range(len(text) + 1, len(outs["next"][0])):
-            if (
-                outs["next"][0][i].argmax()
-                == self.mappings["vocab"]["<end of sequence>"]
-            ):
-                done = True
-                break
-            answer_text.append(self.mappings["rvocab"][outs["next"][0][i].argmax()])
-
-        if done or len(answer_text) >= 98:
-            return "".join(answer_text)
-        else:
-            return self.chat(text, "".join(answer_text))
+        x_text = self.encoder.encode([text], False, "left")
+        position = min(len(text), self.encoder.context_size - 1)
+        for i in range(max_length):
+            outs = self.chat_model({"text": x_text}, training=False)
+            next_id = self._sample(
+                np.asarray(outs["next"][0, position], dtype=np.float64),
+                temperature,
+                top_k,
+            )
+            if next_id == self.encoder.end_of_sequence:
+                return
+            char = self.mappings["rvocab"][next_id]
+            yield self.fallback_symbol if len(char) > 1 else char
+
+            if position < self.encoder.context_size - 1:
+                position += 1
+            else:
+                x_text[0, :-1] = x_text[0, 1:]
+            x_text[0, position] = next_id
+
+    def _sample(
+        self, scores: npt.NDArray, temperature: float, top_k: int | None
+    ) -> int:
+        # never emit padding or a new begin of sequence
+        scores[[0, self.encoder.begin_of_sequence]] = 0.0
+        if temperature <= 0:
+            return int(scores.argmax())
+
+        logits = np.log(np.maximum(scores, 1e-12)) / temperature
+        if top_k is not None and top_k < len(logits):
+            logits[logits < np.partition(logits, -top_k)[-top_k]] = -np.inf
+        p = np.exp(logits - logits.max())
+        return int(np.random.choice(len(p), p=p / p.sum()))
+
+
+class NLUBatcher(metaclass=Singleton):
+    """Collect concurrent NLU requests and predict them in micro-batches.
+
+    Requests arriving within `batch_window` seconds of the first waiting request are
+    stacked, up to `max_batch_size`, and run through the model in one forward pass.
+    Both values are read from `settings.MODELS["nlu"]`. Cached predictions are
+    returned without entering a batch.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.model = NLUModel()
+        self.batch_window = float(settings.MODELS["nlu"].get("batch_window", 0.005))
+        self.max_batch_size = int(settings.MODELS["nlu"].get("max_batch_size", 32))
+
+        self._queue: list[tuple[str, Future]] = []
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(
+            target=self._run, name="nlu-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for prediction, the future resolves to its prediction.
+
+        Cached predictions are resolved right away without waiting for a batch.
+        """
+        future: Future = Future()
+        self.model.reload_if_changed()
+        text = self.model._clean_text(text)
+        prediction = self.model.cache.get(text)
+        if prediction is not None:
+            future.set_result(prediction)
+            return future
+        with self._condition:
+            self._queue.append((text, future))
+            self._condition.notify()
+        return future
+
+    def predict(self, text: str) -> dict:
+        """Predict intent, blocks until the batch containing `text` is done."""
+        return self.submit(text).result()
+
+    def _next_batch(self) -> list[tuple[str, Future]]:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = time.monotonic() + self.batch_window
+            while len(self._queue) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            batch = self._queue[: self.max_batch_size]
+            del self._queue[: self.max_batch_size]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [
+                (text, future)
+                for text, future in self._next_batch()
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            texts, futures = zip(*batch)
+            try:
+                predictions = self.model._predict(list(texts))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, prediction in zip(futures, predictions):
+                    future.set_result(prediction)
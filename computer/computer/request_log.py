@@ -0,0 +1,95 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app request log module."""
+
+import atexit
+import sys
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.translation import gettext_lazy as _
+from profiles.models import NLURequest
+
+from .utils import Singleton
+
+
+class NLURequestWriter(metaclass=Singleton):
+    """Buffer NLU requests and persist them with a single `bulk_create`.
+
+    With `background` enabled a worker thread flushes the buffer as soon as
+    `batch_size` records are waiting or `flush_interval` seconds have passed, so
+    responses never wait for the write. Otherwise every record is saved right away.
+    All values are read from `settings.NLU_REQUEST_LOG`.
+    """
+
+    def __init__(self):
+        """Init."""
+        config = getattr(settings, "NLU_REQUEST_LOG", {})
+        self.background = config.get("background", True)
+        self.batch_size = config.get("batch_size", 64)
+        self.flush_interval = config.get("flush_interval", 1.0)
+
+        self._buffer: list[NLURequest] = []
+        self._condition = threading.Condition()
+        if self.background:
+            self._worker = threading.Thread(
+                target=self._run, name="nlu-request-writer", daemon=True
+            )
+            self._worker.start()
+            atexit.register(self.flush)
+
+    def add(self, *nlu_requests: NLURequest):
+        """Add unsaved NLU requests to be written."""
+        if not self.background:
+            NLURequest.objects.bulk_create(nlu_requests)
+            return
+
+        with self._condition:
+            self._buffer.extend(nlu_requests)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    async def aadd(self, *nlu_requests: NLURequest):
+        """Add unsaved NLU requests to be written, asynchronous variant of `add`."""
+        if not self.background:
+            await NLURequest.objects.abulk_create(nlu_requests)
+        else:
+            self.add(*nlu_requests)
+
+    def flush(self):
+        """Write all buffered NLU requests."""
+        with self._condition:
+            nlu_requests = self._buffer
+            self._buffer = []
+        if nlu_requests:
+            NLURequest.objects.bulk_create(nlu_requests, batch_size=self.batch_size)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._buffer) >= self.batch_size, self.flush_interval
+                )
+            try:
+                self.flush()
+            except Exception as e:
+                print(_("Could not write NLU requests."), e, file=sys.stderr)
+            finally:
+                close_old_connections()
@@ -199,6 +199,29 @@ MODELS = {}
 APIS = {}
 
 
+# NLU request log
+
+NLU_REQUEST_LOG = {
+    "background": True,
+    "batch_size": 64,
+    "flush_interval": 1.0,  # seconds
+}
+
+
+# Answer index
+
+ANSWER_INDEX = {
+    "ttl": 300.0,  # seconds until the index is rebuilt regardless of changes
+}
+
+
+# Timezone cache
+
+TIMEZONE_CACHE = {
+    "ttl": 300,  # seconds a user's timezone is cached
+}
+
+
 # Load local settings
 
 LOCAL_SETTINGS_PATH = BASE_DIR / "local.py"
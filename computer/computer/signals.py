@@ -0,0 +1,45 @@
+# Copyright (C) 2017-2025 J. Nathanael Philipp (jnphilipp) <nathanael@philipp.land>
+#
+# Computer - personal assistant.
+#
+# This file is part of computer.
+#
+# computer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# computer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with computer. If not, see <http://www.gnu.org/licenses/>
+"""Computer Django app signals module."""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.core.cache import cache
+from intents.models import Intent
+from profiles.models import Profile
+from texts.models import Answer, Attribute
+
+from .answers import AnswerIndex
+from .middleware import timezone_cache_key
+
+
+@receiver([post_save, post_delete], sender=Answer)
+@receiver([post_save, post_delete], sender=Attribute)
+@receiver([post_save, post_delete], sender=Intent)
+@receiver(m2m_changed, sender=Answer.attributes.through)
+@receiver(m2m_changed, sender=Intent.answers.through)
+def invalidate_answer_index(sender, **kwargs):
+    """Invalidate the answer index when answers, attributes or intents change."""
+    AnswerIndex().invalidate()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_timezone(sender, instance: Profile, **kwargs):
+    """Remove the cached timezone of the user of a changed profile."""
+    cache.delete(timezone_cache_key(instance.user_id))
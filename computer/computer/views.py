@@ -18,20 +18,26 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Computer Django app views."""
 
+import asyncio
 import json
-import numpy as np
 
-from django.db.models import Count
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.conf import settings
+from django.http import (
+    JsonResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    QueryDict,
+)
 from django.utils import timezone, translation
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django_markdowns.templatetags.markdowns import md
 from intents import intents
 from profiles.models import NLURequest
-from texts.models import Answer, Attribute
 
-from .nlu_models import NLUModel
+from .answers import AnswerIndex
+from .nlu_models import NLUBatcher, NLUModel
+from .request_log import NLURequestWriter
 
 
 @csrf_exempt
@@ -56,6 +62,13 @@ def markdown(request):
     return JsonResponse({"text": md(text)})
 
 
+def nlu_cache(request):
+    """Handels GET request for the nlu prediction cache statistics."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    return JsonResponse(NLUModel().cache.stats())
+
+
 @csrf_exempt
 def nlu(request):
     """Handels POST request for nlu.
@@ -66,85 +79,186 @@ def nlu(request):
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
 
-    params = request.POST.copy()
+    params = _nlu_params(request)
+    nlu_request = NLURequest(
+        user=request.user if request.user.is_authenticated else None,
+        params=params.dict(),
+    )
+
+    if "text" in params:
+        text = params.pop("text")[0].lower()
+    else:
+        NLURequestWriter().add(nlu_request)
+        return HttpResponseBadRequest('The parameter "text" was not given.')
+
+    try:
+        outs = NLUBatcher().predict(text)
+        return JsonResponse(_nlu_answer(request, text, outs, nlu_request))
+    except Exception as e:
+        return JsonResponse(_nlu_error(nlu_request, e))
+    finally:
+        NLURequestWriter().add(nlu_request)
+
+
+@csrf_exempt
+def nlu_batch(request):
+    """Handels POST request for nlu of several texts at once.
+
+    The texts are queued on the `NLUBatcher` together, so they are predicted in
+    batches of at most `max_batch_size`, results are returned in the same order. At
+    most `settings.MODELS["nlu"]["max_texts"]` texts are accepted per request.
+
+    POST parameters:
+        texts: the texts to do the nlu for, either as a JSON list or a JSON object
+            with a list under "texts"
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
     if "application/json" == request.META.get("CONTENT_TYPE"):
-        params.update(json.loads(request.body.decode("utf-8")))
+        texts = json.loads(request.body.decode("utf-8"))
+        if isinstance(texts, dict):
+            texts = texts.get("texts")
+    elif "texts" in request.POST:
+        texts = request.POST.getlist("texts")
+    else:
+        texts = None
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return HttpResponseBadRequest('The parameter "texts" was not given.')
+    max_texts = int(settings.MODELS["nlu"].get("max_texts", 1000))
+    if len(texts) > max_texts:
+        return HttpResponseBadRequest(
+            'The parameter "texts" has more than %d texts.' % max_texts
+        )
 
-    nlu_request = NLURequest.objects.create(
-        user=request.user if request.user.is_authenticated else None,
+    texts = [text.lower() for text in texts]
+    nlu_requests = [
+        NLURequest(
+            user=request.user if request.user.is_authenticated else None,
+            params={"text": text},
+        )
+        for text in texts
+    ]
+    results = []
+    try:
+        futures = [NLUBatcher().submit(text) for text in texts]
+        for text, future, nlu_request in zip(texts, futures, nlu_requests):
+            try:
+                results.append(_nlu_answer(request, text, future.result(), nlu_request))
+            except Exception as e:
+                results.append(_nlu_error(nlu_request, e))
+    except Exception as e:
+        results = [_nlu_error(nlu_request, e) for nlu_request in nlu_requests]
+    finally:
+        NLURequestWriter().add(*nlu_requests)
+
+    return JsonResponse(
+        {
+            "response_date": timezone.now().strftime("%Y-%m-%dT%H:%M:%S:%f%z"),
+            "results": results,
+        }
+    )
+
+
+@csrf_exempt
+async def nlu_async(request):
+    """Handels POST request for nlu, asynchronous variant of `nlu` for ASGI.
+
+    POST parameters:
+        text: the text to do the nlu for
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    params = _nlu_params(request)
+    user = await request.auser()
+    nlu_request = NLURequest(
+        user=user if user.is_authenticated else None,
         params=params.dict(),
     )
 
     if "text" in params:
         text = params.pop("text")[0].lower()
     else:
+        await NLURequestWriter().aadd(nlu_request)
         return HttpResponseBadRequest('The parameter "text" was not given.')
 
     try:
-        model = NLUModel()
-        outs = model.predict(text)
+        outs = await asyncio.wrap_future(NLUBatcher().submit(text))
 
         translation.activate(outs["language"]["name"])
         request.LANGUAGE_CODE = translation.get_language()
-
         nlu_request.nlu_model_output = outs
-        nlu_request.save()
 
-        fn = getattr(intents, outs["intent"]["name"])
-        properties = fn(
+        properties = await intents.acall(
+            outs["intent"]["name"],
             text=text,
             language=outs["language"]["name"],
             user_agent=request.headers.get("User-Agent"),
             **outs["entities"]
         )
         nlu_request.intent_output = properties
-        nlu_request.save()
-
-        attributes = []
-        for k, v in properties.items():
-            attrs = Attribute.objects.filter(key=k)
-            if attrs.count() > 1:
-                if attrs.filter(value=v).exists():
-                    attributes.append(attrs.filter(value=v)[0].pk)
-                else:
-                    attributes.append(attrs.filter(value=None)[0].pk)
-            elif attrs.count() == 1:
-                attributes.append(attrs[0].pk)
-
-        answer = Answer.objects.annotate(num_attrs=Count("attributes")).filter(
-            intents__name=outs["intent"]["name"],
-            num_attrs=len(attributes),
-            language=outs["language"]["name"],
-        )
-        for attribute in attributes:
-            answer = answer.filter(attributes__id=attribute)
-
-        if answer.count() >= 1:
-            answer = np.random.choice(answer)
-        else:
-            answer = Answer.objects.filter(
-                intents__name="fallback", language=request.LANGUAGE_CODE
-            ).order_by("?")[:1][0]
-
-        nlu_request.answer = answer.text % properties
-        nlu_request.save()
-        return JsonResponse(
-            {
-                "response_date": timezone.now().strftime("%Y-%m-%dT%H:%M:%S:%f%z"),
-                "intent": outs["intent"]["name"],
-                "certainty": outs["intent"]["p"],
-                "replies": [md(answer.text % properties)],
-            }
+
+        answer = await AnswerIndex().achoose(
+            outs["intent"]["name"],
+            outs["language"]["name"],
+            properties,
+            request.LANGUAGE_CODE,
         )
+        nlu_request.answer = answer % properties
+        return JsonResponse(_nlu_result(outs, nlu_request.answer))
     except Exception as e:
-        text = _("An error occured while processing your request.")
-        nlu_request.answer = text + " " + str(e)
-        nlu_request.save()
-        return JsonResponse(
-            {
-                "response_date": timezone.now().strftime("%Y-%m-%dT%H:%M:%S:%f%z"),
-                "intent": "error",
-                "certainty": 1.0,
-                "replies": [text, str(e)],
-            }
-        )
+        return JsonResponse(_nlu_error(nlu_request, e))
+    finally:
+        await NLURequestWriter().aadd(nlu_request)
+
+
+def _nlu_params(request) -> QueryDict:
+    params = request.POST.copy()
+    if "application/json" == request.META.get("CONTENT_TYPE"):
+        params.update(json.loads(request.body.decode("utf-8")))
+    return params
+
+
+def _nlu_answer(request, text: str, outs: dict, nlu_request: NLURequest) -> dict:
+    translation.activate(outs["language"]["name"])
+    request.LANGUAGE_CODE = translation.get_language()
+    nlu_request.nlu_model_output = outs
+
+    fn = getattr(intents, outs["intent"]["name"])
+    properties = fn(
+        text=text,
+        language=outs["language"]["name"],
+        user_agent=request.headers.get("User-Agent"),
+        **outs["entities"]
+    )
+    nlu_request.intent_output = properties
+
+    answer = AnswerIndex().choose(
+        outs["intent"]["name"],
+        outs["language"]["name"],
+        properties,
+        request.LANGUAGE_CODE,
+    )
+    nlu_request.answer = answer % properties
+    return _nlu_result(outs, nlu_request.answer)
+
+
+def _nlu_result(outs: dict, answer: str) -> dict:
+    return {
+        "response_date": timezone.now().strftime("%Y-%m-%dT%H:%M:%S:%f%z"),
+        "intent": outs["intent"]["name"],
+        "certainty": outs["intent"]["p"],
+        "replies": [md(answer)],
+    }
+
+
+def _nlu_error(nlu_request: NLURequest, e: Exception) -> dict:
+    text = _("An error occured while processing your request.")
+    nlu_request.answer = text + " " + str(e)
+    return {
+        "response_date": timezone.now().strftime("%Y-%m-%dT%H:%M:%S:%f%z"),
+        "intent": "error",
+        "certainty": 1.0,
+        "replies": [text, str(e)],
+    }
@@ -18,6 +18,11 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Intents Django app intents module."""
 
+import sys
+
+from asgiref.sync import sync_to_async
+from inspect import iscoroutinefunction
+
 from .date import holiday as date_holiday
 from .date import general as date_general
 from .time import general as time_general
@@ -37,6 +42,20 @@ greet = base
 greet_feelings = base
 thankyou = base
 
+
+async def acall(name: str, **kwargs) -> dict:
+    """Call the intent `name` from async code.
+
+    Coroutine intents are awaited directly, all others run in a worker thread.
+    """
+    if name not in __all__:
+        raise AttributeError(f"Unknown intent {name}.")
+    fn = getattr(sys.modules[__name__], name)
+    if iscoroutinefunction(fn):
+        return await fn(**kwargs)
+    return await sync_to_async(fn, thread_sensitive=False)(**kwargs)
+
+
 __all__ = (
     "date_holiday",
     "date_general",
@@ -19,22 +19,138 @@
 """Intents Django app wather intents."""
 
 import requests
+import sys
+import threading
+import time
 
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone, formats
+from django.utils.translation import gettext_lazy as _
+from requests.adapters import HTTPAdapter
 
 
-def _api_call(endpoint: str, params: dict = {}) -> dict:
-    url = (
-        f'{settings.APIS["WEATHER"]["BASE_URL"]}/'
-        + f'{settings.APIS["WEATHER"]["VERSION"]}/{endpoint}'
-    )
-    params["APPID"] = settings.APIS["WEATHER"]["APPID"]
+class WeatherClient:
+    """Weather API client.
 
-    r = requests.get(url, headers=params)
-    r.raise_for_status()
-    return r.json()
+    Requests go through a pooled `requests.Session` with a timeout. Responses are
+    cached for `ttl` seconds keyed on endpoint, city id, language and units. For
+    another `stale_ttl` seconds an expired response is still served while it is
+    refreshed in the background.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        version: str,
+        appid: str,
+        timeout: float = 5.0,
+        ttl: float = 3 * 3600.0,
+        stale_ttl: float = 3600.0,
+        pool_size: int = 10,
+    ):
+        """Init."""
+        self.url = f"{base_url}/{version}"
+        self.appid = appid
+        self.timeout = timeout
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache: dict[tuple, tuple[float, dict]] = {}
+        self._refreshing: set[tuple] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "WeatherClient":
+        """Create a client from `settings.APIS["WEATHER"]`."""
+        config = settings.APIS["WEATHER"]
+        return cls(
+            config["BASE_URL"],
+            config["VERSION"],
+            config["APPID"],
+            timeout=config.get("TIMEOUT", 5.0),
+            ttl=config.get("CACHE_TTL", 3 * 3600.0),
+            stale_ttl=config.get("STALE_TTL", 3600.0),
+        )
+
+    def get(self, endpoint: str, params: dict, headers: dict | None = None) -> dict:
+        """Get the response of `endpoint`, from the cache if possible."""
+        key = (endpoint, params.get("id"), params.get("lang"), params.get("units"))
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            elif age < self.ttl + self.stale_ttl:
+                self._revalidate(key, endpoint, params, headers)
+                return entry[1]
+        return self._fetch(key, endpoint, params, headers)
+
+    def clear(self):
+        """Clear the cache."""
+        with self._lock:
+            self._cache.clear()
+
+    def _fetch(
+        self, key: tuple, endpoint: str, params: dict, headers: dict | None
+    ) -> dict:
+        r = self.session.get(
+            f"{self.url}/{endpoint}",
+            params=params | {"APPID": self.appid},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        data = r.json()
+        with self._lock:
+            self._cache[key] = (time.monotonic(), data)
+        return data
+
+    def _revalidate(
+        self, key: tuple, endpoint: str, params: dict, headers: dict | None
+    ):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch(key, endpoint, params, headers)
+            except Exception as e:
+                print(_("Could not refresh weather data."), e, file=sys.stderr)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+_client: WeatherClient | None = None
+
+
+def get_client() -> WeatherClient:
+    """Get the weather client, created from the settings on first use."""
+    global _client
+    if _client is None:
+        _client = WeatherClient.from_settings()
+    return _client
+
+
+def set_client(client: WeatherClient | None):
+    """Replace the weather client, e.g. with one pointing to a stub server."""
+    global _client
+    _client = client
+
+
+def _api_call(endpoint: str, params: dict, headers: dict | None = None) -> dict:
+    return get_client().get(endpoint, params, headers)
 
 
 def general(text: str, language: str, **kwargs) -> dict:
@@ -44,13 +160,14 @@ def general(text: str, language: str, **kwargs) -> dict:
         "lang": language,
         "id": "2879139",
         "units": "metric",
-        "user-agent": kwargs["user_agent"],
     }
+    headers = {"User-Agent": kwargs["user_agent"]} if kwargs.get("user_agent") else None
 
     temp_max = None
     temp_min = None
     counts: dict[str, int] = {}
-    for data in _api_call(settings.APIS["WEATHER"]["GENRAL_ENDPOINT"], params)["list"]:
+    forecast = _api_call(settings.APIS["WEATHER"]["GENRAL_ENDPOINT"], params, headers)
+    for data in forecast["list"]:
         if day.date() == datetime.utcfromtimestamp(data["dt"]).date():
             if temp_max:
                 temp_max = max(temp_max, data["main"]["temp_max"])
@@ -135,7 +135,10 @@ class Profile(models.Model):
 class NLURequest(models.Model):
     """NLU request."""
 
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created at"))
+    # set when the instance is made, NLURequestWriter saves requests later
+    created_at = models.DateTimeField(
+        default=timezone.now, editable=False, verbose_name=_("Created at")
+    )
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
 
     user = models.ForeignKey(
@@ -19,9 +19,13 @@
 """Texts Django app answer command."""
 
 import csv
+import itertools
 
+from computer.answers import AnswerIndex
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from intents.models import Intent
+from typing import Iterable, Iterator
 
 from ...models import Answer, Attribute
 
@@ -34,56 +38,145 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         """Add arguments."""
         parser.add_argument("path", help="CSV file to import.")
+        parser.add_argument(
+            "--batch-size", default=1000, type=int, help="Rows per insert."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only show what would change.",
+        )
 
     def handle(self, *args, **options):
         """Handle."""
+        self.attributes = {}
+        for pk, key, value in Attribute.objects.values_list("pk", "key", "value"):
+            self.attributes[(key, value)] = pk
+            # a key without value matches the attribute without value, or else the
+            # only attribute with that key
+            if value is None or key not in self.attributes:
+                self.attributes[key] = pk
+            elif (key, None) not in self.attributes:
+                self.attributes[key] = None
+        self.intents = dict(Intent.objects.values_list("name", "pk"))
+
+        answers = {}
         with open(options["path"], "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
             fieldnames = reader.fieldnames
-
             for row in reader:
-                attributes = []
-                if "attributes" in fieldnames:
-                    attributes = self._attributes(row["attributes"])
+                answers[(row["answer"], row["language"])] = (
+                    (
+                        self._attributes(row["attributes"])
+                        if "attributes" in fieldnames
+                        else None
+                    ),
+                    self._intents(row["intents"]) if "intents" in fieldnames else None,
+                )
+
+        batch_size = options["batch_size"]
+        ids = self._ids(answers.keys(), batch_size)
+        new = [key for key in answers.keys() if key not in ids]
+        self.stdout.write(
+            "* Answers: %d created, %d already exist." % (len(new), len(ids))
+        )
 
-                intents = []
-                if "intents" in fieldnames:
-                    intents = self._intents(row["intents"])
+        # relations are keyed by (text, language), new answers have no pk yet
+        changes = []
+        for name, through, target, column in [
+            ("Attributes", Answer.attributes.through, "attribute_id", 0),
+            ("Intents", Intent.answers.through, "intent_id", 1),
+        ]:
+            keys = [
+                key for key, values in answers.items() if values[column] is not None
+            ]
+            pairs = {(key, pk) for key in keys for pk in answers[key][column]}
+            existing = self._existing(
+                through,
+                target,
+                {ids[key]: key for key in keys if key in ids},
+                batch_size,
+            )
+            removed = [row for pair, row in existing.items() if pair not in pairs]
+            added = [pair for pair in pairs if pair not in existing]
+            self.stdout.write(
+                "* %s: %d added, %d removed." % (name, len(added), len(removed))
+            )
+            changes.append((through, target, added, removed))
 
-                answer, created = Answer.objects.get_or_create(
-                    text=row["answer"], language=row["language"]
+        if options["dry_run"]:
+            return
+
+        with transaction.atomic():
+            Answer.objects.bulk_create(
+                [Answer(text=text, language=language) for text, language in new],
+                batch_size=batch_size,
+            )
+            ids.update(self._ids(new, batch_size))
+            for through, target, added, removed in changes:
+                for rows in self._chunks(removed, batch_size):
+                    through.objects.filter(pk__in=rows).delete()
+                through.objects.bulk_create(
+                    [through(answer_id=ids[key], **{target: pk}) for key, pk in added],
+                    batch_size=batch_size,
                 )
-                if created:
-                    self.stdout.write('* Answer created: "%s"' % answer)
-                else:
-                    self.stderr.write('* Answer "%s" already exists.' % answer)
+        # bulk inserts send no signals
+        AnswerIndex().invalidate()
+
+    def _ids(
+        self, keys: Iterable[tuple[str, str]], batch_size: int
+    ) -> dict[tuple[str, str], int]:
+        """Ids of the existing answers, queried in batches."""
+        keys = set(keys)
+        ids = {}
+        for texts in self._chunks({text for text, language in keys}, batch_size):
+            for pk, text, language in Answer.objects.filter(text__in=texts).values_list(
+                "pk", "text", "language"
+            ):
+                if (text, language) in keys:
+                    ids[(text, language)] = pk
+        return ids
 
-                self.stdout.write('  * Attributes: "%s"' % attributes)
-                answer.attributes.set(attributes, clear=True)
-                self.stdout.write('  * Intents: "%s"' % intents)
-                answer.intents.set(intents, clear=True)
+    def _existing(
+        self,
+        through,
+        target: str,
+        answers: dict[int, tuple[str, str]],
+        batch_size: int,
+    ) -> dict[tuple[tuple[str, str], int], int]:
+        """Through rows of the given answers, keyed by answer key and target pk."""
+        existing = {}
+        for pks in self._chunks(answers.keys(), batch_size):
+            for row, answer, pk in through.objects.filter(
+                answer_id__in=pks
+            ).values_list("pk", "answer_id", target):
+                existing[(answers[answer], pk)] = row
+        return existing
 
-    def _attributes(self, value):
+    def _chunks(self, values: Iterable, size: int) -> Iterator[list]:
+        values = iter(values)
+        while chunk := list(itertools.islice(values, size)):
+            yield chunk
+
+    def _attributes(self, value: str) -> list[int]:
         attrs = []
         for attr in value.split(";"):
-            if "=" in attr:
-                try:
-                    k, v = attr.split("=")
-                    attrs.append(Attribute.objects.get(key=k, value=v))
-                except Attribute.DoesNotExist:
-                    self.stderr.write('Attribute "%s=%s" not found.' % k, v)
+            if not attr:
+                continue
+            key = tuple(attr.split("=", 1)) if "=" in attr else attr
+            if self.attributes.get(key) is None:
+                self.stderr.write('Attribute "%s" not found.' % attr)
             else:
-                try:
-                    attrs.append(Attribute.objects.get(key=attr))
-                except Attribute.DoesNotExist:
-                    self.stderr.write('Attribute "%s" not found.' % attr)
+                attrs.append(self.attributes[key])
         return attrs
 
-    def _intents(self, value):
+    def _intents(self, value: str) -> list[int]:
         intents = []
         for name in value.split(";"):
-            try:
-                intents.append(Intent.objects.get(name=name))
-            except Intent.DoesNotExist:
+            if not name:
+                continue
+            if name in self.intents:
+                intents.append(self.intents[name])
+            else:
                 self.stderr.write('Intent "%s" not found.' % name)
         return intents
@@ -19,10 +19,13 @@
 """Texts Django app trigger command."""
 
 import csv
+import itertools
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from intents.models import Intent
 from texts.models import Trigger
+from typing import Iterable, Iterator
 
 
 class Command(BaseCommand):
@@ -33,34 +36,78 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         """Add arguments."""
         parser.add_argument("path", help="CSV file to import.")
+        parser.add_argument(
+            "--batch-size", default=1000, type=int, help="Rows per insert and update."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only show what would change.",
+        )
 
     def handle(self, *args, **options):
         """Handle."""
+        self.intents = dict(Intent.objects.values_list("name", "pk"))
+
+        triggers = {}
         with open(options["path"], "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-
+            column = "intent" if "intent" in (reader.fieldnames or []) else "intents"
             for row in reader:
-                intents = []
-                if "intents" in fieldnames:
-                    intents = self._intents(row["intents"])
+                intent = self._intent(row[column]) if column in row else None
+                if intent is not None:
+                    triggers[(row["trigger"], row["language"])] = intent
+                else:
+                    self.stderr.write('* Trigger "%s" skipped.' % row["trigger"])
 
-                trigger, created = Trigger.objects.get_or_create(
-                    text=row["trigger"], language=row["language"]
+        existing = self._existing(triggers.keys(), options["batch_size"])
+        new = [
+            Trigger(text=text, language=language, intent_id=intent)
+            for (text, language), intent in triggers.items()
+            if (text, language) not in existing
+        ]
+        changed = []
+        for key, trigger in existing.items():
+            if trigger.intent_id != triggers[key]:
+                trigger.intent_id = triggers[key]
+                changed.append(trigger)
+        self.stdout.write(
+            "* Triggers: %d created, %d intents changed, %d unchanged."
+            % (len(new), len(changed), len(triggers) - len(new) - len(changed))
+        )
+
+        if not options["dry_run"]:
+            with transaction.atomic():
+                Trigger.objects.bulk_create(new, batch_size=options["batch_size"])
+                Trigger.objects.bulk_update(
+                    changed, ["intent"], batch_size=options["batch_size"]
                 )
-                if created:
-                    self.stdout.write('* Trigger created: "%s"' % trigger)
-                else:
-                    self.stderr.write('* Trigger "%s" already exists.' % trigger)
 
-                self.stdout.write('  * Intents: "%s"' % intents)
-                trigger.intents.set(intents, clear=True)
+    def _existing(
+        self, keys: Iterable[tuple[str, str]], batch_size: int
+    ) -> dict[tuple[str, str], Trigger]:
+        """Existing triggers with the given keys, queried in batches."""
+        keys = set(keys)
+        existing = {}
+        for texts in self._chunks({text for text, language in keys}, batch_size):
+            for trigger in Trigger.objects.filter(text__in=texts).only(
+                "pk", "text", "language", "intent_id"
+            ):
+                if (trigger.text, trigger.language) in keys:
+                    existing[(trigger.text, trigger.language)] = trigger
+        return existing
+
+    def _chunks(self, values: Iterable, size: int) -> Iterator[list]:
+        values = iter(values)
+        while chunk := list(itertools.islice(values, size)):
+            yield chunk
 
-    def _intents(self, value):
-        intents = []
-        for name in value.split(";"):
-            try:
-                intents.append(Intent.objects.get(name=name))
-            except Intent.DoesNotExist:
-                self.stderr.write('Intent "%s" not found.' % name)
-        return intents
+    def _intent(self, value: str) -> int | None:
+        names = [name for name in value.split(";") if name]
+        if len(names) != 1:
+            self.stderr.write('Expected one intent, got "%s".' % value)
+        elif names[0] not in self.intents:
+            self.stderr.write('Intent "%s" not found.' % names[0])
+        else:
+            return self.intents[names[0]]
+        return None
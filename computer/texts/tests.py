@@ -18,6 +18,83 @@
 # along with computer. If not, see <http://www.gnu.org/licenses/>
 """Texts Django app tests."""
 
+import tempfile
+
+from django.core.management import call_command
 from django.test import TestCase
+from intents.models import Intent
+from io import StringIO
+
+from .models import Answer, Attribute, Trigger
+
+
+class AnswerCommandTestCase(TestCase):
+    """Answer command tests."""
+
+    def setUp(self):
+        """Set up."""
+        Intent.objects.create(name="greet")
+        Intent.objects.create(name="bye")
+        Attribute.objects.create(key="time", value="morning")
+        answer = Answer.objects.create(text="hello", language="en")
+        answer.intents.add(Intent.objects.get(name="bye"))
+
+    def _call(self, csv: str, dry_run: bool) -> str:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(csv)
+            f.flush()
+            out = StringIO()
+            call_command("answer", f.name, dry_run=dry_run, stdout=out, stderr=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        """Dry run reports the same changes as the real run."""
+        csv = (
+            "answer,language,attributes,intents\n"
+            + "hello,en,time=morning,greet\n"
+            + "hi,en,time=morning,greet\n"
+            + "hey,en,,greet;bye\n"
+        )
+        dry_run = self._call(csv, True)
+        self.assertEqual(Answer.objects.count(), 1)
+        self.assertEqual(dry_run, self._call(csv, False))
+        self.assertIn("* Answers: 2 created, 1 already exist.", dry_run)
+        self.assertIn("* Attributes: 2 added, 0 removed.", dry_run)
+        self.assertIn("* Intents: 4 added, 1 removed.", dry_run)
+        self.assertEqual(Intent.objects.get(name="greet").answers.count(), 3)
+        self.assertEqual(Intent.objects.get(name="bye").answers.count(), 1)
+        self.assertIn("* Intents: 0 added, 0 removed.", self._call(csv, False))
+
+
+class TriggerCommandTestCase(TestCase):
+    """Trigger command tests."""
+
+    def setUp(self):
+        """Set up."""
+        greet = Intent.objects.create(name="greet")
+        Intent.objects.create(name="bye")
+        Trigger.objects.create(text="hello", language="en", intent=greet)
+        Trigger.objects.create(text="bye", language="en", intent=greet)
+        Trigger.objects.create(text="bye", language="de", intent=greet)
 
-# Create your tests here.
+    def test_batches(self):
+        """A CSV larger than the batch size is loaded in batches."""
+        csv = "trigger,language,intent\n" + "".join(
+            "text %d,en,greet\n" % i for i in range(7)
+        )
+        csv += "hello,en,greet\nbye,en,bye\n"
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(csv)
+            f.flush()
+            out = StringIO()
+            call_command("trigger", f.name, batch_size=2, stdout=out)
+        self.assertIn(
+            "* Triggers: 7 created, 1 intents changed, 1 unchanged.", out.getvalue()
+        )
+        self.assertEqual(Trigger.objects.count(), 10)
+        self.assertEqual(
+            Trigger.objects.get(text="bye", language="en").intent.name, "bye"
+        )
+        self.assertEqual(
+            Trigger.objects.get(text="bye", language="de").intent.name, "greet"
+        )